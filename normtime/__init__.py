@@ -1 +1 @@
-from .normtime import NormTime, TIMEX, normalize
+from .normtime import NormTime, PreparedDoc, TIMEX, normalize, get_engine, reset_engine
@@ -0,0 +1,97 @@
+""" Precompiled rule set, to skip JSON parsing and regex compilation at start up.
+
+The artifact is a pickle of the rule set built by rule.compile_rules().
+Regexes are stored as the code of the regex engine, so loading them does
+not parse or compile the patterns again. This code depends on the Python
+version, which is recorded in the header together with the format version
+and the SHA-256 of the rule files it was compiled from; an artifact that
+does not match the running Python or the rule files of the engine is ignored.
+"""
+import os
+import sys
+import hashlib
+import copyreg
+import pickle
+import _sre
+import re
+try:
+    from re import _parser as sre_parse, _compiler as sre_compile
+except ImportError: # python < 3.11
+    import sre_parse, sre_compile
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+ARTIFACT_FILE = f'{HERE}/../rule/compiled_rules.pickle'
+ARTIFACT_VERSION = 1 # Increment when the output of compile_rules() changes
+
+
+def file_digest(path):
+    with open(path, 'rb') as f:
+        return hashlib.sha256(f.read()).hexdigest()
+
+
+def artifact_header(sources):
+    """
+    Args:
+        sources (List[str]): Rule files the artifact is compiled from, in a fixed order.
+    """
+    return {'version': ARTIFACT_VERSION,
+            'python': sys.implementation.cache_tag,
+            'sre_magic': _sre.MAGIC,
+            'sources': [file_digest(source) for source in sources]}
+
+
+def pattern_code(repattern):
+    """ Arguments of _sre.compile for the compiled pattern (see re._compiler.compile). """
+    flags = repattern.flags
+    p = sre_parse.parse(repattern.pattern, flags)
+    state = p.state if hasattr(p, 'state') else p.pattern # python 3.7
+    code = [int(x) for x in sre_compile._code(p, flags)] # plain ints for pickle
+    indexgroup = [None] * state.groups
+    for k, i in state.groupdict.items():
+        indexgroup[i] = k
+    return (repattern.pattern, flags | state.flags, code, state.groups-1,
+            dict(state.groupdict), tuple(indexgroup))
+
+
+def load_pattern(args):
+    return _sre.compile(*args)
+
+
+def reduce_pattern(repattern):
+    return load_pattern, (pattern_code(repattern),)
+
+
+def write_artifact(path, compiled, sources):
+    """ Write the output of rule.compile_rules() to path.
+
+    Args:
+        path (str)
+        compiled (dict)
+        sources (List[str]): Rule files it was compiled from, as given to load_artifact().
+    """
+    with open(path, 'wb') as f:
+        pickle.dump(artifact_header(sources), f)
+        pickler = pickle.Pickler(f, protocol=pickle.HIGHEST_PROTOCOL)
+        pickler.dispatch_table = copyreg.dispatch_table.copy()
+        pickler.dispatch_table[re.Pattern] = reduce_pattern
+        pickler.dump(compiled)
+
+
+def load_artifact(path, sources):
+    """ Load the artifact if it exists, was written by this version and
+    was compiled from these source files, as they are now. Returns None otherwise.
+
+    Args:
+        path (str)
+        sources (List[str]): Rule files the artifact was compiled from.
+
+    Returns:
+        dict: The output of rule.compile_rules().
+    """
+    try:
+        with open(path, 'rb') as f:
+            if pickle.load(f) != artifact_header(sources):
+                return None
+            return pickle.load(f)
+    except Exception: # a missing or broken artifact falls back to the rule files
+        return None
@@ -0,0 +1,137 @@
+import os
+import io
+import sys
+import json
+import argparse
+from collections import deque
+from .rule import compile_rules, RULE_FILE, GENGO_FILE
+from .artifact import ARTIFACT_FILE, write_artifact
+
+
+def compile_command(args):
+    write_artifact(args.output, compile_rules(args.rule_file, args.gengo_file),
+                   (args.rule_file, args.gengo_file))
+    print(f'Wrote {os.path.normpath(args.output)}')
+
+
+def serve_command(args):
+    from .server import serve
+    serve(args.host, args.port, workers=args.workers, max_batch=args.max_batch,
+          batch_wait=args.batch_wait/1000, max_queue=args.max_queue, matcher=args.matcher,
+          **budget_kwargs(args))
+
+
+def predict_command(args):
+    from .normtime import NormTime
+    from .document import doc_from_json
+
+    nt = NormTime(matcher=args.matcher, **budget_kwargs(args))
+    if args.input == '-':
+        fin = io.TextIOWrapper(sys.stdin.buffer, encoding='utf-8')
+    else:
+        fin = open(args.input, encoding='utf-8')
+    if args.output == '-':
+        fout = io.TextIOWrapper(sys.stdout.buffer, encoding='utf-8')
+    else:
+        fout = open(args.output, 'w', encoding='utf-8')
+
+    # One record per input line, in order: {"id": ..} when the line is sent
+    # to normalize_batch, or {"id": .., "error": ..} when it is not a document
+    records = deque()
+
+    def read_docs():
+        for line in fin:
+            if not line.strip():
+                continue
+            obj = None
+            try:
+                obj = json.loads(line)
+                doc, dct = doc_from_json(obj)
+            except Exception as e: # one bad line must not end the run
+                error = str(e) if isinstance(e, ValueError) else f'{type(e).__name__}: {e}'
+                records.append({'id': obj.get('id') if isinstance(obj, dict) else None,
+                                'error': error})
+                continue
+            records.append({'id': obj.get('id')})
+            yield doc, dct
+
+    def write(record):
+        if record['id'] is None:
+            del record['id']
+        fout.write(json.dumps(record, ensure_ascii=False) + '\n')
+
+    with fin, fout:
+        for results in nt.normalize_batch(read_docs(), processes=args.processes,
+                                          chunksize=args.chunksize, return_exceptions=True):
+            while 'error' in records[0]:
+                write(records.popleft())
+            record = records.popleft()
+            if isinstance(results, Exception):
+                record['error'] = f'{type(results).__name__}: {results}'
+            else:
+                record['results'] = results
+            write(record)
+        while records:
+            write(records.popleft())
+
+
+def add_budget_arguments(parser):
+    parser.add_argument('--max_matches', type=int, default=None,
+                        help="Candidate rule matches per TIMEX at most (default: unlimited).")
+    parser.add_argument('--max_chains', type=int, default=None,
+                        help="Chains explored per TIMEX at most (default: unlimited).")
+    parser.add_argument('--max_seconds', type=float, default=None,
+                        help="Seconds of rule matching, chain search and composition per TIMEX (default: unlimited).")
+    parser.add_argument('--max_timex_chars', type=int, default=None,
+                        help="Characters per TIMEX at most, longer ones are not normalized (default: unlimited).")
+
+
+def budget_kwargs(args):
+    return {'max_matches': args.max_matches, 'max_chains': args.max_chains,
+            'max_seconds': args.max_seconds, 'max_timex_chars': args.max_timex_chars}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='normtime')
+    subparsers = parser.add_subparsers(dest='command')
+    subparsers.required = True
+
+    compile_parser = subparsers.add_parser(
+        'compile', help="Precompile the rule files for fast start up.")
+    compile_parser.add_argument('-o', '--output', default=ARTIFACT_FILE)
+    compile_parser.add_argument('--rule_file', default=RULE_FILE)
+    compile_parser.add_argument('--gengo_file', default=GENGO_FILE)
+    compile_parser.set_defaults(func=compile_command)
+
+    serve_parser = subparsers.add_parser(
+        'serve', help="Serve normalization over HTTP/JSON (see normtime/server.py).")
+    serve_parser.add_argument('--host', default='127.0.0.1')
+    serve_parser.add_argument('--port', type=int, default=8000)
+    serve_parser.add_argument('--workers', type=int, default=None,
+                              help="Worker processes (default: number of CPUs, 0: in the server process).")
+    serve_parser.add_argument('--max_batch', type=int, default=64, help="Documents per micro-batch.")
+    serve_parser.add_argument('--batch_wait', type=float, default=2,
+                              help="Milliseconds to wait for more documents of a micro-batch.")
+    serve_parser.add_argument('--max_queue', type=int, default=1024,
+                              help="Documents waiting for a micro-batch at most; more are answered with 503.")
+    serve_parser.add_argument('--matcher', default='loop', choices=['loop', 'scanner'])
+    add_budget_arguments(serve_parser)
+    serve_parser.set_defaults(func=serve_command)
+
+    predict_parser = subparsers.add_parser(
+        'predict', help="Normalize JSONL documents (see normtime/document.py), writing JSONL results.")
+    predict_parser.add_argument('input', nargs='?', default='-', help="JSONL file (default: stdin).")
+    predict_parser.add_argument('-o', '--output', default='-', help="JSONL file (default: stdout).")
+    predict_parser.add_argument('--processes', type=int, default=1)
+    predict_parser.add_argument('--chunksize', type=int, default=1,
+                                help="Documents sent to a worker process at once.")
+    predict_parser.add_argument('--matcher', default='loop', choices=['loop', 'scanner'])
+    add_budget_arguments(predict_parser)
+    predict_parser.set_defaults(func=predict_command)
+
+    args = parser.parse_args(argv)
+    args.func(args)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,70 @@
+""" JSON form of the documents given to NormTime.normalize().
+
+    {"dct": "2013-06-01",
+     "sentences": [{"sentence": "来年4/26に会う。", "spans": [[0, 6, "DATE"]]}, ..]}
+
+Spans are [begin_strid, end_strid, TYPE] in the sentence; TYPE can be
+omitted for DATE, and "dct" for today. "dct" is YYYY-MM-DD, optionally
+followed by a time ("2013-06-01T10:00").
+"""
+import re
+from datetime import date
+from .normtime import TIMEX
+from .const import TimexType
+
+TIMEX_TYPES = (TimexType.DATE, TimexType.TIME, TimexType.DURATION, TimexType.SET)
+DCT_RE = re.compile(r'(\d{4})-(\d{2})-(\d{2})(T\S*)?')
+
+
+def is_valid_dct(dct):
+    m = DCT_RE.fullmatch(dct) if isinstance(dct, str) else None
+    if m is None:
+        return False
+    try:
+        date(int(m.group(1)), int(m.group(2)), int(m.group(3)))
+    except ValueError:
+        return False
+    return True
+
+
+def doc_from_json(obj):
+    """ Convert a decoded JSON document into the arguments of NormTime.normalize().
+
+    Args:
+        obj (dict)
+
+    Returns:
+        Tuple[List[Tuple[str, List[TIMEX]]], str]: doc and dct.
+
+    Raises:
+        ValueError: obj is not a document.
+    """
+    if not isinstance(obj, dict) or not isinstance(obj.get('sentences'), list):
+        raise ValueError('A document must be an object with a list of "sentences"')
+    dct = obj.get('dct') or date.today().isoformat()
+    if not is_valid_dct(dct):
+        raise ValueError(f'Invalid dct, not YYYY-MM-DD: {dct!r}')
+
+    doc = []
+    for sent_obj in obj['sentences']:
+        sentence = sent_obj.get('sentence') if isinstance(sent_obj, dict) else None
+        if not isinstance(sentence, str):
+            raise ValueError(f'A sentence must be an object with a "sentence" string: {sent_obj!r}')
+        spans = sent_obj.get('spans', [])
+        if not isinstance(spans, list):
+            raise ValueError(f'"spans" must be a list: {spans!r}')
+        timexes = []
+        for span in spans:
+            if not isinstance(span, list) or len(span) not in (2, 3):
+                raise ValueError(f'Invalid span: {span!r}')
+            begin_strid, end_strid = span[0], span[1]
+            TYPE = span[2] if len(span) == 3 else TimexType.DATE
+            if not (isinstance(begin_strid, int) and isinstance(end_strid, int)
+                    and 0 <= begin_strid <= end_strid <= len(sentence)):
+                raise ValueError(f'Invalid span: {span!r}')
+            if TYPE not in TIMEX_TYPES:
+                raise ValueError(f'Invalid TYPE: {TYPE!r}')
+            timexes.append(TIMEX(str=sentence[begin_strid:end_strid],
+                                 begin_strid=begin_strid, end_strid=end_strid, TYPE=TYPE))
+        doc.append((sentence, timexes))
+    return doc, dct
@@ -0,0 +1,96 @@
+import os
+import re
+import json
+import threading
+from collections import namedtuple, defaultdict
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+GENGO_FILE = f'{HERE}/../rule/gengo.json'
+
+Era = namedtuple('Era', ('name', 'begin_year', 'prefix'))
+
+
+class EraIndex(object):
+    """ Index of the era names (元号) in gengo.json.
+
+    Eras with a "prefix" (平成: H, ..) are normalized as prefixed years
+    (H02), which calc_value expands into western years.
+    """
+    # Prefixes expanded in values, in the order they are tried, and the
+    # multiplier of the decade digit ("H1X"), as calc_value has always done.
+    # 令和 (R) values are left as they are.
+    VALUE_PREFIXES = (('H', 1), ('S', 10))
+
+    def __init__(self, gengo_dicts):
+        self.name2era = {} # {name: Era}, the first entry wins
+        for gd in gengo_dicts:
+            if gd['pattern'] not in self.name2era:
+                self.name2era[gd['pattern']] = Era(name=gd['pattern'],
+                                                   begin_year=gd['process_type'],
+                                                   prefix=gd.get('prefix'))
+
+        # For masking: {first char: [length of era name, ..]}
+        heads = defaultdict(set)
+        for name in self.name2era:
+            heads[name[0]].add(len(name))
+        self.heads = {c: sorted(lengths) for c, lengths in heads.items()}
+
+        prefix2era = {era.prefix: era for era in self.name2era.values() if era.prefix}
+        self.value_expanders = []
+        for prefix, decade_scale in self.VALUE_PREFIXES:
+            if prefix in prefix2era:
+                self.value_expanders.append(
+                    (prefix,
+                     re.compile(f'{prefix}(\\d\\d)'), # 平成
+                     re.compile(f'{prefix}(\\d)X'),   # 平成X年代
+                     re.compile(f'{prefix}(\\d)'),
+                     prefix2era[prefix].begin_year,
+                     decade_scale))
+
+    def __contains__(self, name):
+        return name in self.name2era
+
+    def to_year(self, name, num):
+        """ Year value of 「<name><num>年」, or None for an unknown era.
+
+        Args:
+            name (str): Era name.
+            num (str): Year number in the era.
+
+        Returns:
+            str: "H02" for prefixed eras, otherwise the western year.
+        """
+        era = self.name2era.get(name)
+        if era is None:
+            return None
+        if era.prefix:
+            return f'{era.prefix}{int(num):02}'
+        return str(int(num)+era.begin_year)
+
+    def expand_value(self, v):
+        """ Replace a prefixed year in the value with the western year (H25 --> 2013). """
+        for prefix, year_re, decade_re, digit_re, begin_year, decade_scale in self.value_expanders:
+            if prefix not in v:
+                continue
+            m = year_re.search(v)
+            if m:
+                return year_re.sub(str(int(m.group(1))+begin_year), v)
+            if decade_re.search(v):
+                digit = int(digit_re.search(v).group(1))
+                return digit_re.sub(str(digit*decade_scale+begin_year+5)[:-1], v)
+        return v
+
+
+_era_index = None
+_era_index_lock = threading.Lock()
+
+
+def load_era_index():
+    """ Returns the EraIndex of GENGO_FILE, built once per process. """
+    global _era_index
+    if _era_index is None:
+        with _era_index_lock:
+            if _era_index is None:
+                with open(GENGO_FILE) as f:
+                    _era_index = EraIndex(json.load(f))
+    return _era_index
@@ -1,22 +1,205 @@
 import os
-from datetime import datetime
-from collections import namedtuple
+import threading
+import multiprocessing
+from datetime import date
+from collections import namedtuple, deque
 from .rule import ApplyRule
-from .time_composition import resolver
+from .time_composition import resolver, iter_surface, calc_value
+from .stats import Stats
 
 TIMEX = namedtuple('TIMEX', ('str', 'begin_strid', 'end_strid', 'TYPE'))
 
-def normalize(text, TYPE="DATE", dct=datetime.now().strftime('%Y-%m-%d')):
+_engine = None
+_engine_lock = threading.Lock()
+
+
+def get_engine():
+    """ Returns the process-wide NormTime shared by normalize().
+
+    The engine is built on first use, so importing normtime stays cheap.
+    """
+    global _engine
+    engine = _engine
+    if engine is None:
+        with _engine_lock:
+            if _engine is None:
+                _engine = NormTime()
+            engine = _engine
+    return engine
+
+
+def reset_engine():
+    """ Drops the shared engine. The next normalize() call rebuilds it,
+    re-reading the rule files.
+    """
+    global _engine
+    with _engine_lock:
+        _engine = None
+
+
+def normalize(text, TYPE="DATE", dct=None):
+    if dct is None: # today
+        dct = date.today().isoformat()
     timex = TIMEX(str=text, begin_strid=0, end_strid=len(text), TYPE=TYPE)
-    vfs, v = NormTime().normalize([(text,[timex])], dct).__next__()
+    vfs, v = get_engine().normalize([(text,[timex])], dct).__next__()
     return v
 
 
 class NormTime(object):
-    def __init__(self, debug=False):
-        self.apply_rule = ApplyRule(debug)
+    def __init__(self, debug=False, matcher='loop', use_artifact=True, stats=False,
+                 rule_profile=False, max_matches=None, max_chains=None, max_seconds=None,
+                 max_timex_chars=None):
+        """
+        Args:
+            debug (bool)
+            matcher (str): Rule matching engine, 'loop' or 'scanner' (see ApplyRule).
+            use_artifact (bool): Load the precompiled rule set when it is up to date.
+            stats (bool): Record the time and calls of each stage and the
+                matching counters in self.stats (see stats.Stats), readable
+                with self.stats.snapshot(). Documents normalized by the
+                workers of normalize_batch are not recorded.
+            rule_profile (bool): Record the cost and use of each rule in
+                self.apply_rule.rule_profile (see stats.RuleProfile),
+                likewise in this process only.
+            max_matches (int), max_chains (int), max_seconds (float), max_timex_chars (int):
+                Work budget of each TIMEX, unlimited by default (see ApplyRule).
+        """
+        self.init_kwargs = {'debug': debug, 'matcher': matcher, 'use_artifact': use_artifact,
+                            'max_matches': max_matches, 'max_chains': max_chains,
+                            'max_seconds': max_seconds, 'max_timex_chars': max_timex_chars}
+        self.stats = Stats() if stats else None
+        self.apply_rule = ApplyRule(debug, matcher=matcher, use_artifact=use_artifact,
+                                    stats=self.stats, rule_profile=rule_profile,
+                                    max_matches=max_matches, max_chains=max_chains,
+                                    max_seconds=max_seconds, max_timex_chars=max_timex_chars)
 
     def normalize(self, doc, dct):
-        time_compositions = self.apply_rule.get_time_compositions(doc)
-        for vfs, v in resolver(time_compositions, dct):
+        """ Normalize the timexes of a document.
+
+        doc is read one sentence at a time, and each result is yielded as soon
+        as it is final, so doc can be an iterator over a book-length text.
+
+        Args:
+            doc (Iterable[Tuple[str, List[TIMEX]]]): Sentences and their timexes.
+            dct (str): Document creation time, YYYY-MM-DD.
+
+        Yields:
+            Tuple[str, str]: valueFromSurface and value of each timex.
+        """
+        time_compositions = self.apply_rule.iter_time_compositions(doc)
+        for vfs, v in resolver(time_compositions, dct, self.apply_rule.era_index, self.stats):
             yield vfs, v
+
+    def prepare(self, doc):
+        """ Apply the rules to a document and calculate valueFromSurface,
+        which do not depend on the DCT.
+
+        Args:
+            doc (Iterable[Tuple[str, List[TIMEX]]]): As in normalize().
+
+        Returns:
+            PreparedDoc: To resolve value against any number of DCTs.
+        """
+        time_compositions, vfs_list = [], []
+        for cp, vfs in iter_surface(self.apply_rule.iter_time_compositions(doc), self.stats):
+            time_compositions.append(cp)
+            vfs_list.append(vfs)
+        return PreparedDoc(time_compositions, vfs_list, self.apply_rule.era_index, self.stats)
+
+    def normalize_batch(self, docs, processes=None, max_in_flight=None, chunksize=1,
+                        return_exceptions=False):
+        """ Normalize many documents on a process pool.
+
+        Each worker builds its own NormTime once, with the same arguments as
+        this one. At most max_in_flight documents are read ahead of the
+        results, so docs can be a lazy iterable of any length.
+
+        Args:
+            docs (Iterable[Tuple[List, str]]): (doc, dct) pairs, doc as in normalize().
+            processes (int): Number of workers, os.cpu_count() by default.
+                With 1, documents are normalized in this process.
+            max_in_flight (int): Documents submitted but not yet yielded,
+                4 per worker by default.
+            chunksize (int): Documents sent to a worker at once.
+            return_exceptions (bool): Yield the exception raised by a document
+                in place of its results, instead of raising it.
+
+        Yields:
+            List[Tuple[str, str]]: valueFromSurface and value of each timex,
+                one list per document in input order.
+        """
+        processes = processes or os.cpu_count() or 1
+        if processes == 1:
+            for doc, dct in docs:
+                yield _normalize_doc(self, doc, dct, return_exceptions)
+            return
+
+        max_chunks = max(1, (max_in_flight or processes*4) // chunksize)
+        with multiprocessing.Pool(processes, initializer=_init_worker,
+                                  initargs=(self.init_kwargs,)) as pool:
+            pending = deque() # AsyncResults of the chunks in input order
+            chunk = []
+            for doc_dct in docs:
+                chunk.append(doc_dct)
+                if len(chunk) < chunksize:
+                    continue
+                if len(pending) >= max_chunks:
+                    yield from pending.popleft().get()
+                pending.append(pool.apply_async(_normalize_chunk, (chunk, return_exceptions)))
+                chunk = []
+            if chunk:
+                pending.append(pool.apply_async(_normalize_chunk, (chunk, return_exceptions)))
+            while pending:
+                yield from pending.popleft().get()
+
+
+class PreparedDoc(object):
+    """ A document normalized up to valueFromSurface (NormTime.prepare).
+
+    resolve() only calculates value, so re-dating a document against many
+    DCTs costs a fraction of normalize() per DCT. It leaves the document as
+    it is, so it can be called any number of times, also from several threads.
+    """
+    def __init__(self, time_compositions, vfs_list, era_index, stats=None):
+        self.time_compositions = time_compositions
+        self.vfs_list = vfs_list
+        self.era_index = era_index
+        self.stats = stats
+
+    def __len__(self):
+        return len(self.vfs_list)
+
+    def resolve(self, dct):
+        """
+        Args:
+            dct (str): Document creation time, YYYY-MM-DD.
+
+        Returns:
+            List[Tuple[str, str]]: valueFromSurface and value of each timex,
+                the same as list(NormTime.normalize(doc, dct)).
+        """
+        # calc_value replaces the TimeCompositions it modifies, so give it a new list
+        v_list = calc_value(list(self.time_compositions), self.vfs_list, dct,
+                            self.era_index, self.stats)
+        return list(zip(self.vfs_list, v_list))
+
+
+_worker_normtime = None
+
+
+def _init_worker(init_kwargs):
+    global _worker_normtime
+    _worker_normtime = NormTime(**init_kwargs)
+
+
+def _normalize_doc(normtime, doc, dct, return_exceptions):
+    if not return_exceptions:
+        return list(normtime.normalize(doc, dct))
+    try:
+        return list(normtime.normalize(doc, dct))
+    except Exception as e:
+        return e
+
+
+def _normalize_chunk(chunk, return_exceptions):
+    return [_normalize_doc(_worker_normtime, doc, dct, return_exceptions) for doc, dct in chunk]
@@ -1,17 +1,34 @@
 #coding: utf-8
+from functools import lru_cache
 
+STR2NUM_CACHE_SIZE = 4096
+
+# 文字 --> 数値 (十、百、千はその位, 数、何は-1)
+CHAR2DIGIT = {char: digit
+              for digit, chars in enumerate(['0０〇零', '1１一', '2２二', '3３三', '4４四',
+                                             '5５五', '6６六', '7７七', '8８八', '9９九'])
+              for char in chars}
+CHAR2DIGIT.update({u'十': 10, u'百': 100, u'千': 1000, u'数': -1, u'何': -1})
+
+
+@lru_cache(maxsize=STR2NUM_CACHE_SIZE)
 def str2num(string):
     """ stringに対応する数値(str)またはNoneを返す """
     digit_list = get_digit_list(string)
     if None in digit_list: 
         return None
-    len_digit_list = len(digit_list)
-    for i,num in enumerate(digit_list[::-1]):
-        if num == None:
-            digit_list.pop(len_digit_list-i-1)
     return make_num(digit_list)
 
 
+def cache_stats():
+    """ Returns the hits, misses, size and hit rate of the str2num cache. """
+    info = str2num.cache_info()
+    lookups = info.hits + info.misses
+    return {'hits': info.hits, 'misses': info.misses,
+            'size': info.currsize, 'maxsize': info.maxsize,
+            'hit_rate': info.hits/lookups if lookups else 0.0}
+
+
 def make_num(num_list):
     ### 十、百、千を含む場合: ex)二百三十年
     if not num_list:
@@ -65,11 +82,10 @@ def make_num(num_list):
         return ''.join(nums)
     ### 数値のみの場合: ex)1923年
     if min(num_list) >= -1 and max(num_list) <= 9:
-        num = 0
-        for keta, tmpnum in enumerate(num_list[::-1]):
-            if tmpnum != -1:
-                num += tmpnum* (10**keta)
-        nums = [x for x in str(num)]
+        # str(int) of the digits, built as a string: linear in their length
+        # and not limited by sys.get_int_max_str_digits()
+        num = ''.join('0' if tmpnum == -1 else str(tmpnum) for tmpnum in num_list).lstrip('0') or '0'
+        nums = [x for x in num]
         for keta, tmpnum in enumerate(num_list[::-1]):
             if tmpnum == -1:
                 nums[len(nums)-1-keta] = 'X'
@@ -90,30 +106,14 @@ def get_digit_list(uni_strings):
     digit_list = []
     zeroFlag = False
     for uni_string in uni_strings:
-        num = None
-        if uni_string == u'0' or uni_string == u'０' or uni_string == u'〇' or uni_string == u'零': num = 0
-        elif uni_string == u'1' or uni_string == u'１' or uni_string == u'一': num = 1
-        elif uni_string == u'2' or uni_string == u'２' or uni_string == u'二': num = 2
-        elif uni_string == u'3' or uni_string == u'３' or uni_string == u'三': num = 3
-        elif uni_string == u'4' or uni_string == u'４' or uni_string == u'四': num = 4
-        elif uni_string == u'5' or uni_string == u'５' or uni_string == u'五': num = 5
-        elif uni_string == u'6' or uni_string == u'６' or uni_string == u'六': num = 6
-        elif uni_string == u'7' or uni_string == u'７' or uni_string == u'七': num = 7
-        elif uni_string == u'8' or uni_string == u'８' or uni_string == u'八': num = 8
-        elif uni_string == u'9' or uni_string == u'９' or uni_string == u'九': num = 9
-        elif uni_string == u'十': num = 10
-        elif uni_string == u'百': num = 100
-        elif uni_string == u'千': num = 1000
-        elif uni_string in [u'数',u'何']: num = -1
-
         if uni_string == u'ゼ': 
             zeroFlag = True
             continue
-        elif uni_string == u'ロ' and zeroFlag: 
-            num, zeroFlag = 0, False
-        elif zeroFlag: 
-            zeroFlag = False
-        digit_list.append(num)
+        if uni_string == u'ロ' and zeroFlag: 
+            digit_list.append(0)
+        else:
+            digit_list.append(CHAR2DIGIT.get(uni_string))
+        zeroFlag = False
     return digit_list
 
 
@@ -1,15 +1,35 @@
 import os
+import sys
 import json
 import re
+import math
+import logging
+import threading
+from time import perf_counter
 from dataclasses import dataclass
+from bisect import bisect_left
 from collections import defaultdict
 from .time_composition import TimeComposition, TimeData
 from .num_ex import str2num
+from .scanner import RuleScanner, search_windows, pattern_chars
+from .era import EraIndex, GENGO_FILE
+from .artifact import ARTIFACT_FILE, load_artifact
 from .const import TimeClass, TimexType, RefType
+from .stats import timed, RuleProfile
 
 HERE = os.path.dirname(os.path.abspath(__file__))
 RULE_FILE = f'{HERE}/../rule/strRule.json'
-GENGO_FILE = f'{HERE}/../rule/gengo.json'
+
+logger = logging.getLogger(__name__)
+
+_debug_lock = threading.Lock()
+
+
+def debug_print(*items):
+    """ Print the items on their own lines, without lines of other threads in between. """
+    with _debug_lock:
+        print(*items, sep='\n', flush=True)
+
 
 @dataclass
 class RuleMatch:
@@ -19,21 +39,400 @@ class RuleMatch:
     matchobj: str
 
 
+class RuleMatchIndex(object):
+    """ RuleMatches sorted by begin_strid, to find the ones inside a span by bisection. """
+    def __init__(self, matches):
+        self.matches = matches
+        # 空のspanはどのTIMEXにも含まれる
+        self.empty_ids = [i for i, rm in enumerate(matches) if rm.end_strid <= rm.begin_strid]
+        begin_ids = sorted((rm.begin_strid, i) for i, rm in enumerate(matches)
+                           if rm.end_strid > rm.begin_strid)
+        self.begins = [begin for begin, _ in begin_ids]
+        self.ids = [i for _, i in begin_ids]
+
+    def inside(self, begin_strid, end_strid):
+        """ RuleMatches within [begin_strid, end_strid), in their original order. """
+        lo = bisect_left(self.begins, begin_strid)
+        hi = bisect_left(self.begins, end_strid, lo)
+        matches = self.matches
+        ids = [i for i in self.ids[lo:hi] if matches[i].end_strid <= end_strid]
+        if self.empty_ids:
+            ids.extend(self.empty_ids)
+        ids.sort()
+        return [matches[i] for i in ids]
+
+
+def int_max_str_digits():
+    """ Digits of the longest number int() converts from a str, 0 for no limit """
+    get_limit = getattr(sys, 'get_int_max_str_digits', None) # Python 3.11 and later
+    return get_limit() if get_limit is not None else 0
+
+
+class BudgetExceeded(Exception):
+    """ The work budget of a TIMEX is used up, kind: 'chains' or 'seconds' """
+    def __init__(self, kind):
+        super().__init__(kind)
+        self.kind = kind
+
+
+# Chains explored between two checks of the deadline of search_longest_chain
+DEADLINE_CHECK_INTERVAL = 64
+
+
+def search_longest_chain(timex_matches, rules, timex_type, stats=None,
+                         max_chains=None, deadline=None, exceeded=None):
+    """ Returns the successive RuleMatches covering the longest span.
+
+    A chain is valid if it satisfies the poslimit restriction (no TAIL rule
+    but at the end, no SINGLE rule in a chain of several matches) or the
+    timex type restriction (DURATION: only DURATION/MOD/FUN/NUM rules,
+    DATE: at least one DATE rule). Among the valid chains, the one with the
+    longest span and then the fewest matches is chosen. Remaining ties go to
+    the chain listed first by the former exhaustive enumeration: for chains
+    of several matches, the one whose matches except the last have larger
+    indices (compared from the head), then the smaller index for the last.
+
+    Chains never go left, so the best chain from each match is computed
+    once from the best chains of its successors, keeping the search
+    polynomial in the number of matches. A chain is kept as its first match
+    and a back-pointer to the chain of its successor, so that the chains
+    of all matches share their tails and take memory linear in the number
+    of chains explored.
+
+    When more than max_chains chains are explored or the deadline passes,
+    the search stops and the best of the chains computed so far is chosen
+    (at least the single matches).
+
+    Args:
+        timex_matches (List[RuleMatch]): Candidate matches inside a TIMEX.
+        rules (List[dict])
+        timex_type (str)
+        stats (Stats): Counts the chains explored, if given.
+        max_chains (int): Chains to explore at most.
+        deadline (float): time.perf_counter() to stop at.
+        exceeded (Callable[[str], None]): Called with 'chains' or 'seconds'
+            when the search stops early.
+
+    Returns:
+        List[RuleMatch]
+    """
+    n = len(timex_matches)
+    explored = 0
+    begin2ids = defaultdict(list) # {begin_strid: [match id, ..]}
+    for i, rm in enumerate(timex_matches):
+        begin2ids[rm.begin_strid].append(i)
+    # 右にあるmatchから順に計算
+    ids = sorted(range(n), key=lambda i: timex_matches[i].begin_strid, reverse=True)
+    successors = [[j for j in begin2ids.get(rm.end_strid, []) if rm.end_strid > rm.begin_strid]
+                  for rm in timex_matches]
+    poslimits = [rules[rm.rule_id].get('poslimit', '') for rm in timex_matches]
+
+    def next_checkpoint():
+        """ explored at which check_budget is called next """
+        checkpoint = explored + DEADLINE_CHECK_INTERVAL if deadline is not None else math.inf
+        return checkpoint if max_chains is None else min(checkpoint, max_chains)
+
+    def check_budget():
+        nonlocal checkpoint
+        if max_chains is not None and explored >= max_chains:
+            raise BudgetExceeded('chains')
+        if deadline is not None and perf_counter() > deadline:
+            raise BudgetExceeded('seconds')
+        checkpoint = next_checkpoint()
+
+    # A chain is (key, match id, chain of the rest or None), where key is
+    # -end_strid*radix + the number of matches, compared as (-end_strid, count).
+    # Its order key is (-i for each match id but the last, then the last id).
+    radix = n + 1
+
+    def order_less(a, b):
+        """ The order key of chain a is smaller than that of chain b """
+        while a is not b:
+            if a is None:
+                return True
+            if b is None:
+                return False
+            a_id = a[1] if a[2] is None else -a[1]
+            b_id = b[1] if b[2] is None else -b[1]
+            if a_id != b_id:
+                return a_id < b_id
+            a, b = a[2], b[2]
+        return False
+
+    def better(a, b):
+        if a is None or (b is not None and (b[0] < a[0] or (b[0] == a[0] and order_less(b, a)))):
+            return b
+        return a
+
+    def extend(i, chain):
+        """ chain: starting at a successor of i """
+        nonlocal explored
+        if explored >= checkpoint:
+            check_budget()
+        explored += 1
+        return chain[0]+1, i, chain
+
+    def single(i):
+        nonlocal explored
+        explored += 1
+        return -timex_matches[i].end_strid*radix + 1, i, None
+
+    # Chains compared for the longest span, one table per restriction
+    tables = []
+
+    def new_table():
+        table = [None] * n
+        tables.append(table)
+        return table
+
+    def best_chains(node_ok, inner_ok, best):
+        """ Best chain from each match into best, where every match satisfies
+        node_ok and every match but the last one satisfies inner_ok. """
+        for i in ids:
+            if not node_ok(i):
+                continue
+            chain = single(i)
+            if inner_ok(i):
+                for j in successors[i]:
+                    if best[j] is not None:
+                        chain = better(chain, extend(i, best[j]))
+            best[i] = chain
+        return best
+
+    tables.append([single(i) for i in range(n)])
+    checkpoint = next_checkpoint()
+    try:
+        # poslimit restriction
+        best_chains(lambda i: poslimits[i] != 'SINGLE',
+                    lambda i: poslimits[i] != 'TAIL', new_table())
+
+        # timex type restriction
+        if timex_type == TimexType.DURATION:
+            best_chains(
+                lambda i: rules[timex_matches[i].rule_id].get('type', TimexType.DURATION)
+                    in (TimexType.DURATION, TimeClass.MOD, TimeClass.FUN, TimeClass.NUM),
+                lambda i: True, new_table())
+        elif timex_type == TimexType.DATE:
+            free = best_chains(lambda i: True, lambda i: True, [None] * n)
+            with_date = new_table() # DATEのルールを含むchain
+            for i in ids:
+                if rules[timex_matches[i].rule_id].get('type', timex_type) == timex_type:
+                    with_date[i] = free[i]
+                    continue
+                for j in successors[i]:
+                    if with_date[j] is not None:
+                        with_date[i] = better(with_date[i], extend(i, with_date[j]))
+        else:
+            best_chains(lambda i: True, lambda i: True, new_table())
+    except BudgetExceeded as e:
+        if exceeded is not None:
+            exceeded(e.kind)
+
+    # The longest span: key + begin_strid*radix is compared as (-span length, count)
+    best, best_key = None, None
+    for table in tables:
+        for chain in table:
+            if chain is None:
+                continue
+            key = chain[0] + timex_matches[chain[1]].begin_strid*radix
+            if best is None or key < best_key or (key == best_key and order_less(chain, best)):
+                best, best_key = chain, key
+    if stats is not None:
+        stats.count_chains(explored)
+    matches = []
+    while best is not None:
+        matches.append(timex_matches[best[1]])
+        best = best[2]
+    return matches
+
+
+def parse_rangelimit(rule):
+    """ Returns the offsets (start, end) that rangelimit adds to the match span. """
+    for datetypedict in rule['datetypelist']:
+        if "rangelimit" in datetypedict:
+            rangelimit = datetypedict["rangelimit"]
+            if rangelimit[-1] == ':': # :で終わっている場合
+                return (int(rangelimit[:-1]), 0)
+            elif rangelimit[0] == ':':
+                return (0, int(rangelimit[1:]))
+            else:
+                start, end = map(int, rangelimit.split(':'))
+                return (start, end)
+    return (0, 0)
+
+
+def compile_rules(rule_file=RULE_FILE, gengo_file=GENGO_FILE, with_scanner=True):
+    """ Load the rule files and preprocess them for ApplyRule.
+
+    Returns:
+        dict: rules, gengo_dicts, era_index, window_lead, window_trail,
+            alphabet and scanner (None unless with_scanner).
+    """
+    rules = []
+    with open(rule_file) as f:
+        strRuleList = json.load(f)
+        for i in range(len(strRuleList)):
+            pattern = strRuleList[i][u"pattern"]
+            repattern = re.compile(pattern)
+            strRuleList[i][u"repattern"] = repattern
+        rules.extend(strRuleList)
+
+    with open(gengo_file) as f:
+        gengo_dicts = json.load(f)
+
+    # Matching window: a match inside a TIMEX starts at most window_lead
+    # characters before it (rangelimit) and consumes only alphabet characters
+    for rule in rules:
+        rule[u"span_offset"] = parse_rangelimit(rule)
+    offsets = [rule[u"span_offset"][0] for rule in rules]
+    alphabet = set()
+    for rule in rules:
+        chars = pattern_chars(rule[u"pattern"])
+        if chars is None:
+            alphabet = None
+            break
+        alphabet |= chars
+
+    return {'rules': rules,
+            'gengo_dicts': gengo_dicts,
+            'era_index': EraIndex(gengo_dicts),
+            'window_lead': max([0] + offsets),
+            'window_trail': max([0] + [-x for x in offsets]),
+            'alphabet': alphabet,
+            'scanner': RuleScanner(rules) if with_scanner else None}
+
+
 class ApplyRule(object):
-    def __init__(self, debug=False):
+    def __init__(self, debug=False, matcher='loop', use_artifact=True, stats=None,
+                 rule_profile=False, max_matches=None, max_chains=None, max_seconds=None,
+                 max_timex_chars=None):
+        """
+        Args:
+            debug (bool)
+            matcher (str): 'loop' runs every rule over the sentence one by one,
+                'scanner' finds the matches of all rules in one pass (RuleScanner).
+            use_artifact (bool): Load the precompiled rule set (ARTIFACT_FILE)
+                when it was compiled from the rule files as they are now.
+            stats (Stats): Records the time of the stages, if given.
+            rule_profile (bool): Record the cost and use of each rule in
+                self.rule_profile (see stats.RuleProfile).
+            max_matches (int): Work budget of a TIMEX: candidate RuleMatches
+                at most. A TIMEX with more is left without composition.
+            max_chains (int): Work budget of a TIMEX: chains explored by
+                search_longest_chain at most, then the best chain so far is used.
+            max_seconds (float): Work budget of a TIMEX: seconds for its chain
+                search, its composition and its share of the rule matching of
+                the sentence. Rule matching stops between two rules (the loop
+                matcher) or positions (the scanner), then the matches found so
+                far are used; the composition stops between two RuleMatches.
+                One rule over a long span is not interrupted, so bound the
+                span with max_timex_chars too.
+            max_timex_chars (int): Work budget of a TIMEX: characters at most.
+                A longer TIMEX is left without composition, before matching.
+                With any budget, a TIMEX with a number of more digits than
+                int() converts is also left without composition ('chars').
+            Each time a budget is exceeded, self.budget_exceeded[kind] is
+            counted up (kind: 'chars', 'matches', 'chains' or 'seconds'), so
+            is the 'budget_exceeded' counter of stats, and a warning is logged.
+        """
+        if matcher not in ('loop', 'scanner'):
+            raise ValueError(f'Unknown matcher: {matcher}')
         self.debug = debug
-        self.rules = []
-        with open(RULE_FILE) as f:
-            strRuleList = json.load(f)
-            for i in range(len(strRuleList)):
-                pattern = strRuleList[i][u"pattern"]
-                repattern = re.compile(pattern)
-                strRuleList[i][u"repattern"] = repattern
-            self.rules.extend(strRuleList)
+        self.matcher = matcher
+        self.stats = stats
+        self.max_matches = max_matches
+        self.max_chains = max_chains
+        self.max_seconds = max_seconds
+        self.max_timex_chars = max_timex_chars
+        self.budgeted = any(limit is not None for limit in
+                            (max_matches, max_chains, max_seconds, max_timex_chars))
+        self.budget_exceeded = {'chars': 0, 'matches': 0, 'chains': 0, 'seconds': 0}
+        self.budget_lock = threading.Lock()
+
+        compiled = load_artifact(ARTIFACT_FILE, (RULE_FILE, GENGO_FILE)) if use_artifact else None
+        if compiled is None:
+            compiled = compile_rules(with_scanner=(matcher == 'scanner'))
+        self.rules = compiled['rules']
+        self.gengo_dicts = compiled['gengo_dicts']
+        self.era_index = compiled['era_index']
+        self.window_lead = compiled['window_lead']
+        self.window_trail = compiled['window_trail']
+        self.alphabet = compiled['alphabet']
+        self.scanner = compiled['scanner'] if matcher == 'scanner' else None
+        self.rule_profile = RuleProfile(self.rules) if rule_profile else None
+
+        # {char: '#', '&' or None}, filled on first sight. Threads sharing this
+        # ApplyRule may fill the same entry at once, always with the same value.
+        self.char2mask = {}
+
+    def match_rules(self, masked_sent, timexes=None, deadline=None):
+        """ Matching all rules to the masked sentence.
 
-        with open(GENGO_FILE) as f:
-            self.gengo_dicts = json.load(f)
+        Args:
+            masked_sent (str)
+            timexes (List(TIMEX)): When given, only the matches which can lie
+                inside these timexes are searched.
+            deadline (float): time.perf_counter() after which the search stops,
+                returning the matches found until then.
 
+        Returns:
+            List[RuleMatch]
+        """
+        if timexes is None:
+            windows = [(0, len(masked_sent), len(masked_sent))]
+        else:
+            windows = search_windows(masked_sent,
+                                     [(t.begin_strid, t.end_strid) for t in timexes],
+                                     self.alphabet, self.window_lead, self.window_trail)
+
+        if self.scanner:
+            rule_matchobjs = self.scanner.finditer(masked_sent, windows, deadline)
+        elif self.rule_profile is not None:
+            rule_matchobjs = self.finditer_rules_profiled(masked_sent, windows, deadline)
+        else:
+            rule_matchobjs = self.finditer_rules(masked_sent, windows, deadline)
+
+        matches = []
+        for rule_id, matchObj in rule_matchobjs:
+            # rangelimitに対応
+            start, end = self.rules[rule_id][u"span_offset"]
+            matches.append(
+                RuleMatch(begin_strid=matchObj.start()+start,
+                          end_strid=matchObj.end()+end,
+                          rule_id=rule_id,
+                          matchobj=matchObj))
+        return matches
+
+    def finditer_rules(self, masked_sent, windows, deadline=None):
+        """ re.finditer of each rule, restricted to the windows of search_windows(),
+        until the deadline (time.perf_counter()) if given. """
+        for rule_id, rule in enumerate(self.rules):
+            if deadline is not None and perf_counter() > deadline:
+                return
+            repattern = rule[u"repattern"]
+            for begin, end, stop in windows:
+                for matchObj in repattern.finditer(masked_sent, begin, stop):
+                    if matchObj.start() >= end:
+                        break
+                    yield rule_id, matchObj
+
+    def finditer_rules_profiled(self, masked_sent, windows, deadline=None):
+        """ Same as finditer_rules, recording the time of each rule in rule_profile. """
+        rule_profile = self.rule_profile
+        for rule_id, rule in enumerate(self.rules):
+            if deadline is not None and perf_counter() > deadline:
+                return
+            repattern = rule[u"repattern"]
+            start = perf_counter()
+            matchobjs = []
+            for begin, end, stop in windows:
+                for matchObj in repattern.finditer(masked_sent, begin, stop):
+                    if matchObj.start() >= end:
+                        break
+                    matchobjs.append(matchObj)
+            rule_profile.add_time(rule_id, perf_counter()-start)
+            for matchObj in matchobjs:
+                yield rule_id, matchObj
 
     def matching_rule(self, masked_sent, timexes):
         """ Rule matching to the given timexes.
@@ -45,283 +444,305 @@ class ApplyRule(object):
         Returns:
             List[List[RuleMatch]]
         """
-        def arrange_span(span, rule):
-            for datetypedict in rule['datetypelist']:
-                if "rangelimit" in datetypedict:
-                    rangelimit = datetypedict["rangelimit"]
-                    if rangelimit[-1] == ':': # :で終わっている場合
-                        start = int(rangelimit[:-1])
-                        return (span[0]+start, span[1])
-                    elif rangelimit[0] == ':':
-                        end = int(rangelimit[1:])
-                        return (span[0], span[1]+end)
-                    else:
-                        start, end = map(int, rangelimit.split(':'))
-                        return (span[0]+start, span[1]+end)
-            return span
-
-        def search_successive_matches(timex_matches):
-            begin2match = defaultdict(list) # {begin_strid:[match, ..]}
-            for m in timex_matches:
-                begin2match[m.begin_strid].append(m)
-            # 連続するmatch
-            suc_matches = [[x] for x in timex_matches]
-            stack = [[x] for x in timex_matches]
-            while stack:
-                matches = stack.pop()
-                if matches[-1].end_strid not in begin2match:
-                    suc_matches.append(matches)
-                else:
-                    for next_match in begin2match[matches[-1].end_strid]:
-                        stack.append(matches+[next_match])
-                        suc_matches.append(matches+[next_match])
-            return suc_matches
-
-        def check_poslimit_restriction(rms, rules):
-            if any(rules[rm.rule_id].get('poslimit','') == 'TAIL' for rm in rms[:-1]):
-                return False
-            if len(rms) != 1 \
-                and any(rules[rm.rule_id].get('poslimit','') == 'SINGLE' for rm in rms):
-                return False
-            return True
-
-        def check_timex_type_restriction(rms, rules):
-            if timex.TYPE == TimexType.DURATION \
-                and any(rules[rm.rule_id].get('type', TimexType.DURATION) 
-                        not in (TimexType.DURATION, TimeClass.MOD, TimeClass.FUN, TimeClass.NUM) for rm in rms):
-                return False
-            if timex.TYPE == TimexType.DATE \
-                and all(rules[rm.rule_id].get('type', timex.TYPE) != timex.TYPE for rm in rms):
-                return False
-            return True
-
+        if not timexes:
+            return []
+        max_timex_chars = self.max_timex_chars
+        if max_timex_chars is None:
+            matched_timexes = timexes
+        else: # longer ones are left without composition
+            matched_timexes = [timex for timex in timexes
+                               if timex.end_strid - timex.begin_strid <= max_timex_chars]
 
         # Matching all rules
+        stats = self.stats
         matches = []
-        for rule_id, rule in enumerate(self.rules):
-            repattern = rule[u"repattern"]
-            for matchObj in re.finditer(repattern, masked_sent):
-                begin_strid, end_strid = arrange_span(matchObj.span(), rule) # rangelimitに対応
-                matches.append(
-                    RuleMatch(begin_strid=begin_strid, 
-                              end_strid=end_strid, 
-                              rule_id=rule_id, 
-                              matchobj=matchObj))
+        if matched_timexes:
+            deadline = None
+            if self.max_seconds is not None:
+                deadline = perf_counter() + self.max_seconds*len(matched_timexes)
+            matches = timed(stats, 'match_rules', self.match_rules, masked_sent, matched_timexes, deadline)
+            if deadline is not None and perf_counter() > deadline:
+                self.exceed_budget('seconds')
+        if stats is not None:
+            stats.count('matches', len(matches))
+        rule_profile = self.rule_profile
+        if rule_profile is not None:
+            rule_profile.count_matches(matches)
+        match_index = RuleMatchIndex(matches)
 
         # 対象となる各時間表現に該当するルールを探索
         rms_list = []
         for timex in timexes:
+            if max_timex_chars is not None and timex.end_strid - timex.begin_strid > max_timex_chars:
+                self.exceed_budget('chars')
+                rms_list.append([])
+                continue
+
             # List up candidate RuleMatch
-            cand_rms = []
-            for rm in matches:
-                if set(range(timex.begin_strid, timex.end_strid)) \
-                    >= set(range(rm.begin_strid, rm.end_strid)):
-                    cand_rms.append(rm)
+            cand_rms = match_index.inside(timex.begin_strid, timex.end_strid)
             if not cand_rms:
+                if stats is not None:
+                    stats.count('unmatched')
                 rms_list.append([])
                 continue
-
-            # Merge RuleMatches
-            cand_rms_list = search_successive_matches(cand_rms)
-
-            # position filtering
-            for i, rms in list(enumerate(cand_rms_list))[::-1]:
-                if not (check_poslimit_restriction(rms, self.rules) \
-                    or check_timex_type_restriction(rms, self.rules)):
-                    cand_rms_list.pop(i)
-
-            # Use the max length RuleMatches
-            if not cand_rms_list:
+            if self.max_matches is not None and len(cand_rms) > self.max_matches:
+                self.exceed_budget('matches')
                 rms_list.append([])
-            else:
-                match_lens = [x[-1].end_strid-x[0].begin_strid for x in cand_rms_list]
-                cand_rms_list = [cand_rms_list[i] for i,x in enumerate(match_lens) \
-                                 if x==max(match_lens)]
-                rms_list.append(sorted(cand_rms_list, key=lambda x:len(x))[0])
+                continue
+
+            # Merge RuleMatches and use the max length ones
+            deadline = None
+            if self.max_seconds is not None:
+                deadline = perf_counter() + self.max_seconds
+            rms_list.append(timed(stats, 'search_chain', search_longest_chain,
+                                  cand_rms, self.rules, timex.TYPE, stats,
+                                  self.max_chains, deadline, self.exceed_budget))
+            if rule_profile is not None:
+                rule_profile.count_chain(cand_rms, rms_list[-1])
 
-        if self.debug:
-            print(rms_list)
         return rms_list
 
 
+    def exceed_budget(self, kind):
+        """ Record that the work budget of a TIMEX was exceeded. """
+        with self.budget_lock:
+            self.budget_exceeded[kind] += 1
+        if self.stats is not None:
+            self.stats.count('budget_exceeded')
+        logger.warning('Work budget of a TIMEX exceeded: %s', kind)
+
     def get_time_compositions(self, doc):
         """ Convert given timexes into list of TimeComposition.
 
         Returns:
             List[TimeComposition]
         """
-        time_compositions = []
+        return list(self.iter_time_compositions(doc))
 
+    def iter_time_compositions(self, doc):
+        """ Same as get_time_compositions, one sentence at a time.
+
+        Args:
+            doc (Iterable[Tuple[str, List[TIMEX]]])
+
+        Yields:
+            TimeComposition
+        """
+        stats = self.stats
         for sent_id, (sentence, timexes) in enumerate(doc):
-            masked_sent = self.mask_sent(sentence, timexes) # Masking
+            masked_sent = timed(stats, 'mask_sent', self.mask_sent, sentence, timexes) # Masking
+            rms_list = self.matching_rule(masked_sent, timexes)
             if self.debug:
-                print(sentence)
-                print(masked_sent)
+                debug_print(sentence, masked_sent, rms_list)
+            if stats is not None:
+                stats.count('sentences')
+                stats.count('timexes', len(timexes))
 
             # Make TimeComposition objects
-            for i, matches in enumerate(self.matching_rule(masked_sent, timexes)):
-                timex = timexes[i]
-                timecomp = TimeComposition(TYPE=timex.TYPE,
-                                           sent_id=sent_id,
-                                           begin_strid=timex.begin_strid,
-                                           end_strid=timex.end_strid)
-
-                # 検出したがルールにマッチしない場合 
-                if not matches:
-                    time_compositions.append(timecomp)
+            for timex, matches in zip(timexes, rms_list):
+                deadline = None
+                if self.max_seconds is not None:
+                    deadline = perf_counter() + self.max_seconds
+                yield timed(stats, 'composition', self.make_time_composition,
+                            sent_id, sentence, masked_sent, timex, matches, deadline)
+
+    def make_time_composition(self, sent_id, sentence, masked_sent, timex, matches, deadline=None):
+        """ TimeComposition of a timex from its chain of RuleMatches.
+
+        Args:
+            sent_id (int)
+            sentence (str)
+            masked_sent (str)
+            timex (TIMEX)
+            matches (List[RuleMatch]): The chain from matching_rule.
+            deadline (float): time.perf_counter() after which the RuleMatches
+                left are not added.
+
+        Returns:
+            TimeComposition
+        """
+        timecomp = TimeComposition(TYPE=timex.TYPE,
+                                   sent_id=sent_id,
+                                   begin_strid=timex.begin_strid,
+                                   end_strid=timex.end_strid)
+
+        # 検出したがルールにマッチしない場合 
+        if not matches:
+            return timecomp
+
+        # RuleMatch --> TimeComposition
+        for match in matches:
+            if deadline is not None and perf_counter() > deadline:
+                self.exceed_budget('seconds')
+                break
+            rule = self.rules[match.rule_id]
+            for dt in rule['datetypelist']:
+                tc = dt['timeclass']
+                if tc == 'MOD':
                     continue
 
-                # RuleMatch --> TimeComposition
-                for match in matches:
-                    rule = self.rules[match.rule_id]
-                    for dt in rule['datetypelist']:
-                        tc = dt['timeclass']
-                        if tc == 'MOD':
-                            continue
-
-                        val = ''
-                        if 'num' in dt: # 数値の検出
-                            num_span = match.matchobj.span(dt['num'])
-                            num_str = sentence[num_span[0]:num_span[1]]
-                            masked_num_str = masked_sent[num_span[0]:num_span[1]]
-                            if '&' in masked_num_str:
-                                if '#' not in masked_num_str: # 数年 "&"
-                                    val = 'X'
-                                elif masked_num_str.split('&')[0] == '#'*len(masked_num_str.split('&')[0]):  # 十数年 "#&"
-                                    val = str2num(num_str[:masked_num_str.find('&')])[:-1]+'X'
-                            else:
-                                val = str2num(num_str)
-                        if 'gengo' in dt and (val or 'norm' in dt): # 元号の処理
-                            if 'norm' in dt:
-                                val = dt['norm']
-                            gengo_span = match.matchobj.span(dt['gengo'])
-                            gengo = sentence[gengo_span[0]:gengo_span[1]]
-                            for gd in self.gengo_dicts:
-                                if gd['pattern'] == gengo:
-                                    gengo_begin_year = gd['process_type']
-                                    if gengo == '平成': 
-                                        val = f'H{int(val):02}'
-                                    elif gengo == '昭和': 
-                                        val = f'S{int(val):02}'
-                                    elif gengo == '令和': 
-                                        val = f'R{int(val):02}'
-                                    else:
-                                        val = str(int(val)+gengo_begin_year)
-                                    break
-
-                        # マッチしたルール情報をTimeCompositionに加える
-                        if tc in (TimeClass.PHRASE, TimeClass.JUN,
-                                  TimeClass.SEASON, TimeClass.YOUBI):
+                val = ''
+                if 'num' in dt: # 数値の検出
+                    num_span = match.matchobj.span(dt['num'])
+                    num_str = sentence[num_span[0]:num_span[1]]
+                    masked_num_str = masked_sent[num_span[0]:num_span[1]]
+                    if '&' in masked_num_str:
+                        if '#' not in masked_num_str: # 数年 "&"
+                            val = 'X'
+                        elif masked_num_str.split('&')[0] == '#'*len(masked_num_str.split('&')[0]):  # 十数年 "#&"
+                            val = str2num(num_str[:masked_num_str.find('&')])[:-1]+'X'
+                    else:
+                        val = str2num(num_str)
+                    if self.budgeted and val and 0 < int_max_str_digits() < len(val):
+                        self.exceed_budget('chars')
+                        return TimeComposition(TYPE=timex.TYPE, sent_id=sent_id,
+                                               begin_strid=timex.begin_strid,
+                                               end_strid=timex.end_strid)
+                if 'gengo' in dt and (val or 'norm' in dt): # 元号の処理
+                    if 'norm' in dt:
+                        val = dt['norm']
+                    gengo_span = match.matchobj.span(dt['gengo'])
+                    gengo = sentence[gengo_span[0]:gengo_span[1]]
+                    if gengo in self.era_index:
+                        val = self.era_index.to_year(gengo, val)
+
+                # マッチしたルール情報をTimeCompositionに加える
+                if tc in (TimeClass.PHRASE, TimeClass.JUN,
+                          TimeClass.SEASON, TimeClass.YOUBI):
+                    timecomp.add(
+                        TimeData(timeclass=tc, value=dt['norm'],
+                                 timetype=rule.get('type', '')))
+                elif tc == TimeClass.YEARX:
+                    timecomp.add(
+                        TimeData(timeclass=tc, value=val[:-1]+'X',
+                                 timetype=rule.get('type', '')))
+                elif tc == TimeClass.FUN:
+                    if 'fixnum' in dt: # 「半」
+                        if timex.TYPE in (TimexType.DURATION, TimexType.SET):
+                            if timecomp.get_finest_timedata().value.isdigit(): # 1時間半 --> PT1.5H
+                                prev_timedata = timecomp.get_finest_timedata()
+                                val = str(int(prev_timedata.value) + float(dt['fixnum']))
+                                timecomp.add(
+                                    TimeData(timeclass=prev_timedata.timeclass,
+                                             value=val,
+                                             ref=prev_timedata.ref,
+                                             rel=prev_timedata.rel,
+                                             timetype=rule.get('type', '')))
+                            else: # 半年間
+                                val = dt['fixnum']
+                                timecomp.add(
+                                    TimeData(timeclass=tc, value=val,
+                                             timetype=rule.get('type', '')))
+                        elif timex.TYPE == TimexType.TIME and dt['fixnum'] == '0.5':
+                            # 1時半 --> XXXX-XX-XXT01:30
+                            if timecomp.get_finest_timedata().timeclass == TimeClass.HOUR:
+                                timecomp.add(
+                                    TimeData(timeclass=TimeClass.MINUTE,
+                                             value="30",
+                                             timetype=rule.get('type', '')))
+                            elif timecomp.get_finest_timedata().timeclass == TimeClass.MINUTE:
+                                timecomp.add(
+                                    TimeData(timeclass=TimeClass.SECOND,
+                                             value="30",
+                                             timetype=rule.get('type', '')))
+                    if 'fixnum' not in dt:
+                        if 'DCTrelation' in dt:
+                            timecomp.add(
+                                TimeData(timeclass=tc, value="1",
+                                         rel=dt['DCTrelation'],
+                                         timetype=rule.get('type', '')))
+                        elif 'relation' in dt:
+                            timecomp.add(
+                                TimeData(timeclass=tc, value="1",
+                                         ref=RefType.REF, rel=dt['relation'],
+                                         timetype=rule.get('type', '')))
+                else:
+                    if timex.TYPE in (TimexType.DURATION, TimexType.SET):
+                        # default値も使用「年間」--> P1Y
+                        val = dt['norm'] if ('norm' in dt and not val) \
+                            else val if val else "1"
+                        timecomp.add(
+                            TimeData(timeclass=tc, value=val, timetype=rule.get('type', '')))
+                    elif timex.TYPE in (TimexType.DATE, TimexType.TIME):
+                        if 'DCTrelation' in dt: # 「昨年」「来年」
                             timecomp.add(
-                                TimeData(timeclass=tc, value=dt['norm'],
+                                TimeData(timeclass=tc, value="1",
+                                         ref=RefType.DCT, rel=dt['DCTrelation'],
                                          timetype=rule.get('type', '')))
-                        elif tc == TimeClass.YEARX:
+                        elif 'relation' in dt:
                             timecomp.add(
-                                TimeData(timeclass=tc, value=val[:-1]+'X',
+                                TimeData(timeclass=tc, value="1",
+                                         ref=RefType.REF, rel=dt['relation'],
                                          timetype=rule.get('type', '')))
-                        elif tc == TimeClass.FUN:
-                            if 'fixnum' in dt: # 「半」
-                                if timex.TYPE in (TimexType.DURATION, TimexType.SET):
-                                    if timecomp.get_finest_timedata().value.isdigit(): # 1時間半 --> PT1.5H
-                                        prev_timedata = timecomp.get_finest_timedata()
-                                        val = str(int(prev_timedata.value) + float(dt['fixnum']))
-                                        timecomp.add(
-                                            TimeData(timeclass=prev_timedata.timeclass,
-                                                     value=val,
-                                                     ref=prev_timedata.ref,
-                                                     rel=prev_timedata.rel,
-                                                     timetype=rule.get('type', '')))
-                                    else: # 半年間
-                                        val = dt['fixnum']
-                                        timecomp.add(
-                                            TimeData(timeclass=tc, value=val,
-                                                     timetype=rule.get('type', '')))
-                                elif timex.TYPE == TimexType.TIME and dt['fixnum'] == '0.5':
-                                    # 1時半 --> XXXX-XX-XXT01:30
-                                    if timecomp.get_finest_timedata().timeclass == TimeClass.HOUR:
-                                        timecomp.add(
-                                            TimeData(timeclass=TimeClass.MINUTE,
-                                                     value="30",
-                                                     timetype=rule.get('type', '')))
-                                    elif timecomp.get_finest_timedata().timeclass == TimeClass.MINUTE:
-                                        timecomp.add(
-                                            TimeData(timeclass=TimeClass.SECOND,
-                                                     value="30",
-                                                     timetype=rule.get('type', '')))
-                            if 'fixnum' not in dt:
-                                if 'DCTrelation' in dt:
-                                    timecomp.add(
-                                        TimeData(timeclass=tc, value="1",
-                                                 rel=dt['DCTrelation'],
-                                                 timetype=rule.get('type', '')))
-                                elif 'relation' in dt:
-                                    timecomp.add(
-                                        TimeData(timeclass=tc, value="1",
-                                                 ref=RefType.REF, rel=dt['relation'],
-                                                 timetype=rule.get('type', '')))
-                        else:
-                            if timex.TYPE in (TimexType.DURATION, TimexType.SET):
-                                # default値も使用「年間」--> P1Y
-                                val = dt['norm'] if ('norm' in dt and not val) \
-                                    else val if val else "1"
+                        elif tc == TimeClass.HOUR \
+                            and timecomp.get_timedata(tc).value in ('AF','NI'):
+                            val = str(12+int(val))
+                            timecomp.add(
+                                TimeData(timeclass=tc, value=val,
+                                         timetype=rule.get('type', '')))
+                        elif 'norm' in dt and not re.match("GYEARX?", tc): # except "元年"
+                            if dt['norm'] == 'AF' and tc == TimeClass.HOUR and val.isdigit(): # 午後X時
+                                val = str(12+int(val))
+                                timecomp.add(
+                                    TimeData(timeclass=tc, value=val,
+                                             timetype=rule.get('type', '')))
+                            elif dt['norm'] == 'MO' and tc == TimeClass.HOUR and val.isdigit(): # 午前X時
                                 timecomp.add(
-                                    TimeData(timeclass=tc, value=val, timetype=rule.get('type', '')))
-                            elif timex.TYPE in (TimexType.DATE, TimexType.TIME):
-                                if 'DCTrelation' in dt: # 「昨年」「来年」
-                                    timecomp.add(
-                                        TimeData(timeclass=tc, value="1",
-                                                 ref=RefType.DCT, rel=dt['DCTrelation'],
-                                                 timetype=rule.get('type', '')))
-                                elif 'relation' in dt:
-                                    timecomp.add(
-                                        TimeData(timeclass=tc, value="1",
-                                                 ref=RefType.REF, rel=dt['relation'],
-                                                 timetype=rule.get('type', '')))
-                                elif tc == TimeClass.HOUR \
-                                    and timecomp.get_timedata(tc).value in ('AF','NI'):
-                                    val = str(12+int(val))
-                                    timecomp.add(
-                                        TimeData(timeclass=tc, value=val,
-                                                 timetype=rule.get('type', '')))
-                                elif 'norm' in dt and not re.match("GYEARX?", tc): # except "元年"
-                                    if dt['norm'] == 'AF' and tc == TimeClass.HOUR and val.isdigit(): # 午後X時
-                                        val = str(12+int(val))
-                                        timecomp.add(
-                                            TimeData(timeclass=tc, value=val,
-                                                     timetype=rule.get('type', '')))
-                                    elif dt['norm'] == 'MO' and tc == TimeClass.HOUR and val.isdigit(): # 午前X時
-                                        timecomp.add(
-                                            TimeData(timeclass=tc, value=val,
-                                                     timetype=rule.get('type', '')))
-                                    else:
-                                        timecomp.add(
-                                            TimeData(timeclass=tc, value=dt['norm'],
-                                                     timetype=rule.get('type', '')))
-                                elif val != '':
-                                    timecomp.add(
-                                        TimeData(timeclass=tc, value=val,
-                                                 timetype=rule.get('type', '')))
-                time_compositions.append(timecomp)
-
-        return time_compositions
+                                    TimeData(timeclass=tc, value=val,
+                                             timetype=rule.get('type', '')))
+                            else:
+                                timecomp.add(
+                                    TimeData(timeclass=tc, value=dt['norm'],
+                                             timetype=rule.get('type', '')))
+                        elif val != '':
+                            timecomp.add(
+                                TimeData(timeclass=tc, value=val,
+                                         timetype=rule.get('type', '')))
+        return timecomp
+
+    def mask_char(self, char):
+        """ Mask of a character in a TIMEX: '#' for digits, '&' for 数/何, or None. """
+        mask = self.char2mask.get(char, False)
+        if mask is False:
+            if char.isdigit() or str2num(char) is not None: # digit --> #
+                mask = '#'
+            elif char in [u'数', u'何']:
+                mask = '&'
+            else:
+                mask = None
+            self.char2mask[char] = mask
+        return mask
 
+    def mask_sent(self, sentence, timexes):
+        """ Mask digits (#), 数/何 (&) and era names (%) in the timexes.
 
+        Characters are classified through the char2mask table, and era names
+        are looked up by their first character and length, writing into one
+        buffer per sentence.
 
-    def mask_sent(self, sentence, timexes):
-        masked_sent = sentence
+        Returns:
+            str: Masked sentence of the same length.
+        """
+        masked = list(sentence)
+        mask_char = self.mask_char
+        era_index = self.era_index
+        gengo_heads = era_index.heads
         for timex in timexes:
-            for i in range(timex.begin_strid, timex.end_strid):
-                string = sentence[i]
-                if string.isdigit() or str2num(string) is not None: # digit --> #
-                    masked_sent = f'{masked_sent[:i]}#{masked_sent[i+1:]}'
-                elif string in [u'数', u'何']:
-                    masked_sent = f'{masked_sent[:i]}&{masked_sent[i+1:]}'
-                elif i+1 < timex.end_strid and sentence[i:i+2] == 'ゼロ':
-                    masked_sent = f'{masked_sent[:i]}##{masked_sent[i+2:]}'
-            timex_text = sentence[timex.begin_strid:timex.end_strid]
-            for gengo in [x['pattern'] for x in self.gengo_dicts]:
-                if gengo in timex_text:
-                    for i in range(timex.begin_strid+timex_text.index(gengo),
-                                   timex.begin_strid+timex_text.index(gengo)+len(gengo)):
-                        masked_sent = f'{masked_sent[:i]}%{masked_sent[i+1:]}'
-        return masked_sent
+            begin, end = timex.begin_strid, timex.end_strid
+            for i in range(begin, end):
+                mask = mask_char(sentence[i])
+                if mask:
+                    masked[i] = mask
+                elif i+1 < end and sentence[i:i+2] == 'ゼロ':
+                    masked[i] = masked[i+1] = '#'
+            # 各元号の最初の出現をマスク
+            found = set()
+            for i in range(begin, end):
+                if sentence[i] not in gengo_heads:
+                    continue
+                for length in gengo_heads[sentence[i]]:
+                    gengo = sentence[i:i+length]
+                    if i+length <= end and gengo in era_index and gengo not in found:
+                        found.add(gengo)
+                        masked[i:i+length] = '%' * length
+        return ''.join(masked)
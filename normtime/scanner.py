@@ -0,0 +1,236 @@
+import re
+from time import perf_counter
+from collections import defaultdict
+try:
+    from re import _parser as sre_parse, _constants as sre_constants
+except ImportError: # python < 3.11
+    import sre_parse, sre_constants
+
+
+class RuleScanner(object):
+    """ Finds the matches of every rule in one pass over the text.
+
+    Rules are grouped by the characters their patterns can start with.
+    For each such character, the patterns of the group are combined into one
+    regex of lookaheads, so a single regex call at a position tells which
+    rules match there. Rules whose first character cannot be determined
+    are matched one by one with re.finditer.
+    """
+    def __init__(self, rules):
+        self.rules = rules
+        self.fallback_rule_ids = []
+        char2rule_ids = defaultdict(list) # {first char: [rule_id, ..]}
+        for rule_id, rule in enumerate(rules):
+            chars = first_chars(rule['repattern'].pattern)
+            if chars is None:
+                self.fallback_rule_ids.append(rule_id)
+                continue
+            for c in chars:
+                char2rule_ids[c].append(rule_id)
+
+        # Characters sharing the same rules share one combined regex
+        self.char2scanner = {} # {first char: (combined regex, [(rule_id, group), ..])}
+        ids2scanner = {}
+        for c, rule_ids in char2rule_ids.items():
+            rule_ids = tuple(rule_ids)
+            if rule_ids not in ids2scanner:
+                ids2scanner[rule_ids] = self.combine(rule_ids)
+            self.char2scanner[c] = ids2scanner[rule_ids]
+
+    def combine(self, rule_ids):
+        subpatterns = []
+        groups = []
+        group = 1
+        for rule_id in rule_ids:
+            repattern = self.rules[rule_id]['repattern']
+            subpatterns.append(f'(?:(?=({repattern.pattern}))|)')
+            groups.append((rule_id, group))
+            group += 1 + repattern.groups
+        return re.compile(''.join(subpatterns)), groups
+
+    def finditer(self, text, windows=None, deadline=None):
+        """ Same matches as re.finditer of each rule, in rule order.
+
+        Args:
+            text (str)
+            windows (List[Tuple[int, int, int]]): Ranges of start positions to search,
+                as returned by search_windows(). The whole text when omitted.
+            deadline (float): time.perf_counter() after which the search stops,
+                yielding the matches found until then.
+
+        Yields:
+            Tuple[int, re.Match]: rule_id and match object.
+        """
+        if windows is None:
+            windows = [(0, len(text), len(text))]
+        found = [] # [(rule_id, begin_strid, match)]
+        last_ends = [0] * len(self.rules)
+        char2scanner = self.char2scanner
+        timed_out = False
+        for window_begin, window_end, window_stop in windows:
+            for pos in range(window_begin, window_end):
+                if deadline is not None and perf_counter() > deadline:
+                    timed_out = True
+                    break
+                c = text[pos]
+                if c not in char2scanner:
+                    continue
+                combined, groups = char2scanner[c]
+                regs = combined.match(text, pos, window_stop).regs
+                for rule_id, group in groups:
+                    if regs[group][0] >= 0 and pos >= last_ends[rule_id]:
+                        matchobj = self.rules[rule_id]['repattern'].match(text, pos, window_stop)
+                        last_ends[rule_id] = matchobj.end() # re.finditer resumes after the match
+                        found.append((rule_id, pos, matchobj))
+            if timed_out:
+                break
+
+        for rule_id in self.fallback_rule_ids:
+            if timed_out or (deadline is not None and perf_counter() > deadline):
+                break
+            repattern = self.rules[rule_id]['repattern']
+            for window_begin, window_end, window_stop in windows:
+                for matchobj in repattern.finditer(text, window_begin, window_stop):
+                    if matchobj.start() >= window_end:
+                        break
+                    found.append((rule_id, matchobj.start(), matchobj))
+
+        found.sort(key=lambda x: (x[0], x[1]))
+        for rule_id, _, matchobj in found:
+            yield rule_id, matchobj
+
+
+def search_windows(text, spans, alphabet, lead=0, trail=0, gap=16):
+    """ Ranges of start positions where the matches overlapping the spans begin.
+
+    Each span [begin, end) is widened to [begin-lead, end+trail), then its
+    begin is moved left until the preceding character cannot be part of any
+    match (it is not in the alphabet). No match crosses such a position, so
+    re.finditer started there finds the same matches as over the whole text.
+    Likewise a match starting before end cannot go beyond stop, the first
+    character after end outside the alphabet, so it can be used as endpos.
+    Windows closer than gap characters are merged to save search calls.
+
+    Args:
+        text (str)
+        spans (List[Tuple[int, int]])
+        alphabet (Set[str]): Characters the patterns can consume, None if unknown.
+        lead (int)
+        trail (int)
+        gap (int)
+
+    Returns:
+        List[Tuple[int, int, int]]: Sorted, non-overlapping (begin, end, stop).
+    """
+    windows = []
+    for begin, end in sorted(spans):
+        begin = max(0, begin-lead)
+        end = min(len(text), end+trail)
+        if begin >= end:
+            continue
+        if alphabet is None:
+            begin, stop = 0, len(text)
+        else:
+            # Both scans end where the result no longer matters because the
+            # window is merged with the previous one, so that spans packed
+            # in a long run of the alphabet take linear time in total.
+            limit = windows[-1][1]+gap if windows else 0
+            while begin > limit and text[begin-1] in alphabet:
+                begin -= 1
+            stop = end
+            if not (windows and begin <= limit and end <= windows[-1][2]):
+                while stop < len(text) and text[stop] in alphabet:
+                    stop += 1
+        if windows and begin <= windows[-1][1]+gap:
+            windows[-1] = (windows[-1][0], max(windows[-1][1], end), max(windows[-1][2], stop))
+        else:
+            windows.append((begin, end, stop))
+    return windows
+
+
+def pattern_chars(pattern):
+    """ Returns the set of characters a match of the pattern can consume,
+    or None when it is unknown (e.g. the pattern has '.' or a negated class).
+    """
+    return _pattern_chars(sre_parse.parse(pattern))
+
+
+def _pattern_chars(subpattern):
+    chars = set()
+    for op, av in subpattern:
+        if op is sre_constants.LITERAL:
+            chars.add(chr(av))
+        elif op is sre_constants.IN:
+            for in_op, in_av in av:
+                if in_op is sre_constants.LITERAL:
+                    chars.add(chr(in_av))
+                elif in_op is sre_constants.RANGE:
+                    chars.update(chr(x) for x in range(in_av[0], in_av[1]+1))
+                else: # NEGATE, CATEGORY
+                    return None
+        elif op is sre_constants.SUBPATTERN:
+            item_chars = _pattern_chars(av[-1])
+            if item_chars is None:
+                return None
+            chars |= item_chars
+        elif op is sre_constants.BRANCH:
+            for branch in av[1]:
+                item_chars = _pattern_chars(branch)
+                if item_chars is None:
+                    return None
+                chars |= item_chars
+        elif op in (sre_constants.MAX_REPEAT, sre_constants.MIN_REPEAT):
+            item_chars = _pattern_chars(av[2])
+            if item_chars is None:
+                return None
+            chars |= item_chars
+        else: # ANY, AT, lookarounds, ..
+            return None
+    return chars
+
+
+def first_chars(pattern):
+    """ Returns the set of characters a match of the pattern can start with,
+    or None when it is unknown (e.g. the pattern can match an empty string).
+    """
+    chars, nullable = _first_chars(sre_parse.parse(pattern))
+    if nullable:
+        return None
+    return chars
+
+
+def _first_chars(subpattern):
+    chars = set()
+    for op, av in subpattern:
+        if op is sre_constants.LITERAL:
+            item_chars, nullable = {chr(av)}, False
+        elif op is sre_constants.IN:
+            item_chars, nullable = set(), False
+            for in_op, in_av in av:
+                if in_op is sre_constants.LITERAL:
+                    item_chars.add(chr(in_av))
+                elif in_op is sre_constants.RANGE:
+                    item_chars.update(chr(x) for x in range(in_av[0], in_av[1]+1))
+                else: # NEGATE, CATEGORY
+                    return None, True
+        elif op is sre_constants.SUBPATTERN:
+            item_chars, nullable = _first_chars(av[-1])
+        elif op is sre_constants.BRANCH:
+            item_chars, nullable = set(), False
+            for branch in av[1]:
+                branch_chars, branch_nullable = _first_chars(branch)
+                if branch_chars is None:
+                    return None, True
+                item_chars |= branch_chars
+                nullable = nullable or branch_nullable
+        elif op in (sre_constants.MAX_REPEAT, sre_constants.MIN_REPEAT):
+            item_chars, nullable = _first_chars(av[2])
+            nullable = nullable or av[0] == 0
+        else: # ANY, AT, lookarounds, ..
+            return None, True
+        if item_chars is None:
+            return None, True
+        chars |= item_chars
+        if not nullable:
+            return chars, False
+    return chars, True
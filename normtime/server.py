@@ -0,0 +1,249 @@
+""" Local HTTP/JSON normalization server (normtime serve).
+
+    POST /normalize  a document (see document.py)
+                     --> {"results": [[valueFromSurface, value], ..]}, one pair per span
+    GET  /health     --> {"status": "ok"}
+
+Requests arriving together are normalized as one micro-batch: the
+dispatcher waits at most batch_wait seconds for more documents after the
+first one, and sends up to max_batch documents to a worker at once. Each
+worker process keeps one NormTime. Under load, batches fill up while all
+workers are busy, so the per-document overhead drops as the load rises.
+At most max_queue documents wait for a batch, and as many connections
+wait to be accepted; further requests are answered with 503 until the
+queue drains, as are those not normalized within the timeout.
+"""
+import os
+import json
+import time
+import queue
+import threading
+import multiprocessing
+from concurrent.futures import Future, TimeoutError as FutureTimeoutError
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from .normtime import NormTime
+from .document import doc_from_json
+
+
+class Overloaded(Exception):
+    """ The queue of MicroBatcher is full. """
+
+
+class MicroBatcher(object):
+    """ Normalizes documents submitted from many threads in micro-batches. """
+    def __init__(self, workers=None, max_batch=64, batch_wait=0.002, max_queue=1024,
+                 **normtime_kwargs):
+        """
+        Args:
+            workers (int): Worker processes, os.cpu_count() by default.
+                With 0, batches are normalized in this process.
+            max_batch (int): Documents per batch at most.
+            batch_wait (float): Seconds to wait for more documents after the first one.
+            max_queue (int): Documents waiting for a batch at most.
+            normtime_kwargs: Arguments of NormTime.
+        """
+        self.workers = (os.cpu_count() or 1) if workers is None else workers
+        self.max_batch = max_batch
+        self.batch_wait = batch_wait
+        self.max_queue = max_queue
+        self.requests = queue.Queue(max_queue) # (doc, dct, Future), None to stop
+        self.stopping = False
+        self.free_workers = threading.Semaphore(max(1, self.workers))
+        if self.workers:
+            self.pool = multiprocessing.Pool(self.workers, initializer=_init_worker,
+                                             initargs=(normtime_kwargs,))
+            self.normtime = None
+        else:
+            self.pool = None
+            self.normtime = NormTime(**normtime_kwargs)
+        self.dispatcher = threading.Thread(target=self.dispatch, daemon=True)
+        self.dispatcher.start()
+
+    def submit(self, doc, dct):
+        """ Returns a Future of the list of (valueFromSurface, value).
+
+        Raises:
+            Overloaded: max_queue documents are already waiting.
+        """
+        future = Future()
+        try:
+            self.requests.put_nowait((doc, dct, future))
+        except queue.Full:
+            raise Overloaded(f'{self.requests.maxsize} documents are waiting') from None
+        return future
+
+    def dispatch(self):
+        while True:
+            self.free_workers.acquire()
+            batch = self.next_batch()
+            if not batch:
+                break
+            docs = [(doc, dct) for doc, dct, _ in batch]
+            if self.pool is None:
+                try:
+                    results = _normalize_docs(docs, self.normtime)
+                except Exception as e:
+                    self.fail(batch, e)
+                else:
+                    self.finish(batch, results)
+                continue
+            try:
+                self.pool.apply_async(_normalize_docs, (docs,),
+                                      callback=lambda results, batch=batch: self.finish(batch, results),
+                                      error_callback=lambda e, batch=batch: self.fail(batch, e))
+            except Exception as e: # e.g. the pool is terminated
+                self.fail(batch, e)
+
+    def next_batch(self):
+        """ Documents for the next batch, [] when closed. """
+        if self.stopping:
+            return []
+        request = self.requests.get()
+        if request is None:
+            return []
+        batch = [request]
+        deadline = time.monotonic() + self.batch_wait
+        while len(batch) < self.max_batch:
+            try:
+                request = self.requests.get(timeout=max(0, deadline-time.monotonic()))
+            except queue.Empty:
+                break
+            if request is None:
+                self.stopping = True # stop after this batch
+                break
+            batch.append(request)
+        return batch
+
+    def finish(self, batch, results):
+        try:
+            for (_, _, future), (ok, result) in zip(batch, results):
+                if ok:
+                    future.set_result(result)
+                else:
+                    future.set_exception(RuntimeError(result))
+        finally:
+            self.free_workers.release()
+
+    def fail(self, batch, e):
+        try:
+            for _, _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+        finally:
+            self.free_workers.release()
+
+    def close(self):
+        self.requests.put(None)
+        self.dispatcher.join()
+        if self.pool is not None:
+            self.pool.close()
+            self.pool.join()
+
+
+_worker_normtime = None
+
+
+def _init_worker(normtime_kwargs):
+    global _worker_normtime
+    _worker_normtime = NormTime(**normtime_kwargs)
+
+
+def _normalize_docs(docs, normtime=None):
+    """ Returns (True, [(vfs, v), ..]) or (False, error message) for each document,
+    so that one broken document does not fail the others of the batch.
+    """
+    normtime = normtime or _worker_normtime
+    results = []
+    for doc, dct in docs:
+        try:
+            results.append((True, list(normtime.normalize(doc, dct))))
+        except Exception as e:
+            results.append((False, f'{type(e).__name__}: {e}'))
+    return results
+
+
+class NormTimeHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1' # keep-alive
+    batcher = None # MicroBatcher, set by serve()
+    timeout_sec = 60
+
+    def do_GET(self):
+        if self.path == '/health':
+            self.send_json(200, {'status': 'ok'})
+        else:
+            self.send_json(404, {'error': f'Not found: {self.path}'})
+
+    def do_POST(self):
+        try:
+            self.normalize_request()
+        except Exception as e: # never leave the client without a response
+            self.send_json(500, {'error': f'{type(e).__name__}: {e}'})
+
+    def normalize_request(self):
+        if self.path != '/normalize':
+            self.send_json(404, {'error': f'Not found: {self.path}'})
+            return
+        try:
+            length = int(self.headers['Content-Length'])
+        except (TypeError, ValueError):
+            self.send_json(411, {'error': 'Content-Length is required'})
+            return
+        try:
+            doc, dct = doc_from_json(json.loads(self.rfile.read(length)))
+        except ValueError as e: # including json.JSONDecodeError
+            self.send_json(400, {'error': str(e)})
+            return
+        try:
+            future = self.batcher.submit(doc, dct)
+        except Overloaded as e:
+            self.send_json(503, {'error': str(e)})
+            return
+        try:
+            results = future.result(self.timeout_sec)
+        except FutureTimeoutError:
+            self.send_json(503, {'error': f'Not normalized within {self.timeout_sec} seconds'})
+            return
+        except Exception as e:
+            self.send_json(500, {'error': str(e)})
+            return
+        self.send_json(200, {'results': results})
+
+    def send_json(self, status, obj):
+        body = json.dumps(obj, ensure_ascii=False).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass # no access log
+
+
+class NormTimeServer(ThreadingHTTPServer):
+    """ ThreadingHTTPServer with a listen backlog of request_queue_size connections
+    (5 by default), so that bursts of clients wait to be accepted instead of
+    being reset. """
+    def __init__(self, server_address, handler_class, request_queue_size=5):
+        self.request_queue_size = request_queue_size
+        super().__init__(server_address, handler_class)
+
+
+def serve(host='127.0.0.1', port=8000, **batcher_kwargs):
+    """ Serve until interrupted.
+
+    Args:
+        host (str)
+        port (int)
+        batcher_kwargs: Arguments of MicroBatcher.
+    """
+    batcher = MicroBatcher(**batcher_kwargs)
+    handler = type('Handler', (NormTimeHandler,), {'batcher': batcher})
+    with NormTimeServer((host, port), handler, batcher.max_queue) as httpd:
+        print(f'Serving on http://{host}:{httpd.server_port} ({batcher.workers} workers)', flush=True)
+        try:
+            httpd.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            batcher.close()
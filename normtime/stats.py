@@ -0,0 +1,150 @@
+import threading
+from time import perf_counter
+from . import num_ex
+
+# Stages timed by Stats, in pipeline order
+STAGES = ('mask_sent', # ApplyRule.mask_sent
+          'match_rules', # ApplyRule.match_rules, all rules over a sentence
+          'search_chain', # search_longest_chain, per TIMEX
+          'composition', # RuleMatches --> TimeComposition, per TIMEX
+          'calc_vfs', # valueFromSurface, per TIMEX
+          'calc_value') # value, per TIMEX
+
+# Counters of Stats
+COUNTERS = ('sentences', 'timexes',
+            'matches', # RuleMatches found by match_rules
+            'chains', # chains explored by search_longest_chain
+            'unmatched', # TIMEXes without any RuleMatch
+            'budget_exceeded') # work budgets of TIMEXes exceeded (ApplyRule)
+
+
+class Stats(object):
+    """ Cumulative wall time and calls of each stage, and counters.
+
+    Shared by the threads normalizing with the same NormTime. The pipeline
+    takes None instead of a Stats when instrumentation is off, which costs
+    one function call per stage (timed) or one comparison.
+
+    The str2num cache is process-global, so its hits and misses are
+    reported as deltas since the last reset(), counting the lookups of
+    every NormTime of the process; its size is the current one.
+    """
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self.lock:
+            self.seconds = dict.fromkeys(STAGES, 0.0)
+            self.calls = dict.fromkeys(STAGES, 0)
+            self.counters = dict.fromkeys(COUNTERS, 0)
+            self.peak_chains = 0 # chains explored for one TIMEX at most
+            self.str2num_base = num_ex.cache_stats() # str2num cache at the reset
+
+    def add_time(self, stage, seconds):
+        with self.lock:
+            self.seconds[stage] += seconds
+            self.calls[stage] += 1
+
+    def count(self, name, n=1):
+        with self.lock:
+            self.counters[name] += n
+
+    def count_chains(self, n):
+        """ Chains explored for one TIMEX """
+        with self.lock:
+            self.counters['chains'] += n
+            if n > self.peak_chains:
+                self.peak_chains = n
+
+    def snapshot(self):
+        """ Returns a copy of the stats as a JSON-serializable dict:
+        {"stages": {stage: {"calls", "seconds"}}, "counters": {..},
+         "peak_chains": int, "str2num_cache": {"hits", "misses", "size", "maxsize", "hit_rate"}}
+        """
+        with self.lock:
+            return {'stages': {stage: {'calls': self.calls[stage], 'seconds': self.seconds[stage]}
+                               for stage in STAGES},
+                    'counters': dict(self.counters),
+                    'peak_chains': self.peak_chains,
+                    'str2num_cache': self.str2num_cache()}
+
+    def str2num_cache(self):
+        """ num_ex.cache_stats() with the hits and misses since the last reset() """
+        cache = num_ex.cache_stats()
+        base = self.str2num_base
+        if cache['hits'] < base['hits'] or cache['misses'] < base['misses']:
+            base = {'hits': 0, 'misses': 0} # the cache was cleared since
+        hits = cache['hits'] - base['hits']
+        misses = cache['misses'] - base['misses']
+        return dict(cache, hits=hits, misses=misses,
+                    hit_rate=hits/(hits+misses) if hits+misses else 0.0)
+
+
+def timed(stats, stage, func, *args):
+    """ func(*args), adding its wall time to the stage when stats is not None. """
+    if stats is None:
+        return func(*args)
+    start = perf_counter()
+    try:
+        return func(*args)
+    finally:
+        stats.add_time(stage, perf_counter()-start)
+
+
+# Columns of RuleProfile.report()
+RULE_PROFILE_KEYS = ('rule_id', 'pattern', 'seconds', 'matches', 'selected', 'discarded')
+
+
+class RuleProfile(object):
+    """ Cost and use of each rule of strRule.json.
+
+    For each rule: seconds spent in its finditer (the 'loop' matcher only;
+    the 'scanner' matcher runs all rules at once), raw matches in the
+    sentences, and how often a match of it inside a TIMEX was in the chain
+    selected by search_longest_chain or left out of it.
+    """
+    def __init__(self, rules):
+        self.patterns = [rule['pattern'] for rule in rules]
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        n = len(self.patterns)
+        with self.lock:
+            self.seconds = [0.0] * n
+            self.matches = [0] * n
+            self.selected = [0] * n
+            self.discarded = [0] * n
+
+    def add_time(self, rule_id, seconds):
+        with self.lock:
+            self.seconds[rule_id] += seconds
+
+    def count_matches(self, rule_matches):
+        with self.lock:
+            for rm in rule_matches:
+                self.matches[rm.rule_id] += 1
+
+    def count_chain(self, cand_rms, chain):
+        """ cand_rms: RuleMatches inside a TIMEX, chain: the ones selected """
+        chain_ids = set(map(id, chain))
+        with self.lock:
+            for rm in cand_rms:
+                if id(rm) in chain_ids:
+                    self.selected[rm.rule_id] += 1
+                else:
+                    self.discarded[rm.rule_id] += 1
+
+    def report(self, sort_by='seconds', reverse=True):
+        """ One JSON-serializable dict per rule (keys: RULE_PROFILE_KEYS),
+        sorted by one of the keys, largest first by default.
+        """
+        if sort_by not in RULE_PROFILE_KEYS:
+            raise ValueError(f'Unknown key: {sort_by}')
+        with self.lock:
+            rows = [{'rule_id': i, 'pattern': pattern, 'seconds': self.seconds[i],
+                     'matches': self.matches[i], 'selected': self.selected[i],
+                     'discarded': self.discarded[i]}
+                    for i, pattern in enumerate(self.patterns)]
+        return sorted(rows, key=lambda row: row[sort_by], reverse=reverse)
@@ -1,26 +1,70 @@
 import re
-from dataclasses import dataclass
-from datetime import datetime, timedelta
+import sys
+from datetime import date, timedelta
 import math
-import copy
-from collections import OrderedDict, namedtuple, defaultdict
+from collections import namedtuple
 from .const import TimeClass, TimexType, RefType
+from .era import load_era_index
+from .stats import timed
 
-@dataclass
-class TimeData:
-    timeclass: str # Elements of TimeClass
-    value: str
-    ref: str = ""
-    rel: str = None # One of: -1, 0, 1, None
-    timetype: str = ""
+DECADE_RE = re.compile(r'\d\d[\dX]X')
+FY_RE = re.compile(r'FY\d+')
+# Dates accepted by datetime.strptime(.., '%Y-%m-%d')
+YEAR_RE = re.compile(r'\d\d\d\d')
+MONTH_RE = re.compile(r'1[0-2]|0[1-9]|[1-9]')
+DAY_RE = re.compile(r'3[01]|[12]\d|0[1-9]|[1-9]| [1-9]')
 
+class TimeData(object):
+    __slots__ = ('timeclass', 'value', 'ref', 'rel', 'timetype')
+
+    def __init__(self, timeclass, value, ref="", rel=None, timetype=""):
+        self.timeclass = timeclass # Elements of TimeClass
+        self.value = value # str
+        self.ref = ref
+        self.rel = rel # One of: -1, 0, 1, None
+        self.timetype = timetype
+
+    def __repr__(self):
+        return (f'TimeData(timeclass={self.timeclass!r}, value={self.value!r}, '
+                f'ref={self.ref!r}, rel={self.rel!r}, timetype={self.timetype!r})')
+
+    def __eq__(self, other):
+        if other.__class__ is not self.__class__:
+            return NotImplemented
+        return (self.timeclass, self.value, self.ref, self.rel, self.timetype) == \
+            (other.timeclass, other.value, other.ref, other.rel, other.timetype)
+
+
+if sys.version_info >= (3, 8):
+    def reversed_values(d):
+        return reversed(d.values())
+else: # dict views are reversible from Python 3.8
+    def reversed_values(d):
+        return reversed(list(d.values()))
+
+
+# Returned by get_timedata for missing timeclasses, one per default value;
+# they are shared and must not be modified
+_empty_timedata = {}
+
+
+def empty_timedata(value=''):
+    timedata = _empty_timedata.get(value)
+    if timedata is None:
+        timedata = _empty_timedata[value] = TimeData(timeclass='', value=value, ref='', rel=None)
+    return timedata
 
 
 class TimeComposition(object):
     """ A timex consists of Several TimeData classes.
+
+    timedict keeps them by timeclass, from the coarsest to the finest
+    in the order they are added.
     """
+    __slots__ = ('timedict', 'sent_id', 'TYPE', 'begin_strid', 'end_strid')
+
     def __init__(self, TYPE, sent_id=-1, begin_strid=-1, end_strid=-1):
-        self.timedict = OrderedDict()
+        self.timedict = {} # {timeclass: TimeData}
         self.sent_id = sent_id
         self.TYPE = TYPE
         self.begin_strid = begin_strid
@@ -29,38 +73,84 @@ class TimeComposition(object):
     def add(self, timedata):
         self.timedict[timedata.timeclass] = timedata
 
+    def copy(self):
+        """ Copy with its own timedict and TimeData. """
+        new_cp = TimeComposition(self.TYPE, self.sent_id, self.begin_strid, self.end_strid)
+        for td in self.timedict.values():
+            new_cp.add(TimeData(td.timeclass, td.value, td.ref, td.rel, td.timetype))
+        return new_cp
+
     def get_finest_timedata(self):
         if not self.timedict:
-            return TimeData(timeclass='', value='', ref='', rel=None)
-        return list(self.timedict.values())[-1]
+            return empty_timedata()
+        return next(reversed_values(self.timedict))
+
+    def get_timedata_before_finest(self):
+        """ The TimeData added before the finest one. There must be two or more. """
+        timedatas = reversed_values(self.timedict)
+        next(timedatas)
+        return next(timedatas)
 
     def get_timedata(self, tc, default_value=''):
-        if tc not in self.timedict:
-            return TimeData(timeclass='', value=default_value, ref='', rel=None)
-        return self.timedict[tc]
+        timedata = self.timedict.get(tc)
+        if timedata is None:
+            return empty_timedata(default_value)
+        return timedata
 
     def isValid(self):
         return len(self.timedict)
 
 
 
-def resolver(time_compositions, dct):
-    """ Given a list of TimeComposition and DCT, returns vfs and value.
+def resolver(time_compositions, dct, era_index=None, stats=None):
+    """ Given TimeCompositions and DCT, returns vfs and value.
+
+    time_compositions can be an iterator, e.g. over the sentences of a long
+    document. Each result is yielded as soon as it can no longer change,
+    which is once the next TimeComposition is known. Earlier timexes are
+    only kept as References, so memory does not grow with the document.
+    The given TimeCompositions are left as they are, so they can be resolved
+    again, e.g. with another DCT or in another thread.
 
     Args:
-        time_compositions (List[TimeComposition])
+        time_compositions (Iterable[TimeComposition])
         dct (str)
+        era_index (EraIndex): Defaults to the one of gengo.json.
+        stats (Stats): Records the time of calc_vfs and calc_value, if given.
 
     Yields:
         Tuple[str, str]: valueFromSurface and value.
     """
-    time_compositions = resolve_parallel(time_compositions)
-    time_compositions = resolve_functions(time_compositions)
-    vfs_list = calc_vfs(time_compositions)
-    v_list = calc_value(time_compositions, vfs_list, dct)
-    for vfs, v in zip(vfs_list, v_list):
-        yield vfs, v
+    if era_index is None:
+        era_index = load_era_index()
+
+    references = References(dct)
+    # The TimeComposition to resolve and the next one
+    cps, vfs_list, v_list = [], [], []
+    for cp, vfs in iter_surface(time_compositions, stats):
+        cps.append(cp)
+        vfs_list.append(vfs)
+        v_list.append(vfs)
+        if len(cps) == 2:
+            timed(stats, 'calc_value', calc_value_at, 0, cps, v_list, references, era_index)
+            references.add(cps[0], v_list[0])
+            yield vfs_list.pop(0), v_list.pop(0)
+            del cps[0]
+
+    if cps: # the last one
+        timed(stats, 'calc_value', calc_value_at, 0, cps, v_list, references, era_index)
+        yield vfs_list[0], v_list[0]
+
+
+def iter_surface(time_compositions, stats=None):
+    """ The part of resolver that does not depend on the DCT: merges parallel
+    timexes and functions, and calculates valueFromSurface.
 
+    Yields:
+        Tuple[TimeComposition, str]: TimeComposition to pass to calc_value,
+            and its valueFromSurface.
+    """
+    return iter_vfs(map(resolve_function, iter_parallel(time_compositions)), stats)
 
 
 def calc_vfs(time_compositions):
@@ -72,126 +162,141 @@ def calc_vfs(time_compositions):
     Returns:
         List[str]: List of valueFromSurface
     """
-    vfs_list = [None] * len(time_compositions)
-    for cpid, cp in enumerate(time_compositions):
-        if not cp.isValid(): # ルールがマッチしなかった場合
-            vfs_list[cpid] = ''
-            continue
+    return [vfs for _, vfs in iter_vfs(time_compositions)]
 
-        if cp.TYPE in (TimexType.DATE, TimexType.TIME):
-            # 2年前 → Q-2Y
-            if len(cp.timedict) > 1 and TimeClass.FUN in cp.timedict \
-                and list(cp.timedict.values())[-2].timetype != "DATE":
-                vfs = 'Q+' if cp.get_timedata('FUN').rel == 1 \
-                        else 'Q-' if cp.get_timedata('FUN').rel == -1 \
-                        else 'Q'
-                for td in cp.timedict.values():
-                    if td.timeclass in [TimeClass.FUN, TimeClass.MOD]:
-                        continue
-                    if td.timeclass in (TimeClass.HOUR, TimeClass.MINUTE, TimeClass.SECOND):
-                        vfs += 'T'+td.value+td.timeclass[0]
-                    else:
-                        vfs += td.value+td.timeclass[0]
-                vfs_list[cpid] = vfs
-                continue
 
-            # XXXX-XX-XXTXX:XX:XX形式
-            # 各要素の値埋め
-            phrase = None
-            slots = [None]*6 # 6 slots
-            for td in cp.timedict.values():
-                tc = td.timeclass
-                if not td.timeclass:
-                    continue
-                strnum = td.value
-                if tc == TimeClass.CENTURY and slots[0] is None:
-                    slots[0] = 'XXXX' if td.ref \
-                        else f'{int(strnum)-1}XX' if strnum.isdigit() \
-                        else strnum
-                if tc == TimeClass.GYEAR and slots[0] is None:
-                    slots[0] = strnum
-                elif tc == TimeClass.GYEARX and slots[0] is None:
-                    slots[0] = f'{strnum[:-1]}X'
-                elif tc in (TimeClass.YEAR, TimeClass.YEARX) and slots[0] is None:
-                    if td.ref:
-                        slots[0] = 'XXXX'
-                    elif len(strnum) <= 2: # 02年, 直前が平成XX年の場合はH02とする
-                        if cpid > 0 and vfs_list[cpid-1].startswith('H') and strnum.isdigit():
-                            slots[0] = f'H{int(strnum):02}'
-                        elif cpid > 0 and vfs_list[cpid-1].startswith('S') and strnum.isdigit():
-                            slots[0] = f'S{int(strnum):02}'
-                        else: 
-                            slots[0] = 'X'*(4-len(strnum))+strnum
-                    else:
-                        slots[0] = strnum
-                    if tc == TimeClass.YEARX:
-                        slots[0] = f'{slots[0][:-1]}X'
-                elif tc == TimeClass.GFYEAR and slots[0] is None:
-                    slots[0] = f'FY{strnum}'
-                elif tc == TimeClass.FYEAR and slots[0] is None:
-                    slots[0] = 'FYXXXX' if td.ref \
-                                else 'FY'+'X'*(4-len(strnum))+strnum if len(strnum) <= 2\
-                                else f'FY{strnum}'
-                elif tc in [TimeClass.MONTH, TimeClass.SEASON, TimeClass.YOUBI] and slots[1] is None:
-                    slots[1] = 'XX' if strnum == 'X' or td.ref\
-                                    else '0'*(2-len(strnum))+strnum
-                elif tc == TimeClass.WEEK and slots[1] is None:
-                    slots[1] = 'WXX'
-                elif tc in [TimeClass.DAY, TimeClass.JUN] and slots[2] is None:
-                    slots[2] = 'XX' if strnum == 'X' or td.ref\
-                                    else '0'*(2-len(strnum))+strnum
-                elif tc == TimeClass.HOUR and slots[3] is None:
-                    slots[3] = 'XX' if strnum == 'X' or td.ref\
-                                else '0'*(2-len(strnum))+strnum
-                elif tc == TimeClass.MINUTE and not slots[4]:
-                    slots[4] = 'XX' if strnum == 'X' or td.ref\
-                                else '0'*(2-len(strnum))+strnum
-                elif tc == TimeClass.SECOND and not slots[5]:
-                    slots[5] = 'XX' if strnum == 'X' or td.ref\
-                                else '0'*(2-len(strnum))+strnum
-                elif tc == TimeClass.PHRASE:
-                    phrase = strnum
+def iter_vfs(time_compositions, stats=None):
+    """ Same as calc_vfs, one TimeComposition at a time.
 
-            vfs = slots2format(slots)
-            if vfs == '' and phrase:
-                vfs = phrase
-            vfs_list[cpid] = vfs
+    Args:
+        time_compositions (Iterable[TimeComposition])
+        stats (Stats): Records the time of calc_vfs, if given.
 
-        elif cp.TYPE == TimexType.SET \
-            and cp.get_timedata(TimeClass.YOUBI).value: # 毎週火曜日 --> XXXX-WXX-2
-            vfs_list[cpid] = f'XXXX-{cp.get_timedata("YOUBI").value}'
+    Yields:
+        Tuple[TimeComposition, str]: TimeComposition and its valueFromSurface.
+    """
+    prev_vfs = ''
+    for cp in time_compositions:
+        prev_vfs = timed(stats, 'calc_vfs', calc_vfs_one, cp, prev_vfs)
+        yield cp, prev_vfs
 
-        else: # DURATION
-            vfs = 'P'
-            phrase = ''
-            Flag = True
-            used_tcs = [] # P16Y16Yみたいなことがないように
+
+def calc_vfs_one(cp, prev_vfs):
+    """ valueFromSurface of a TimeComposition, given that of the previous one ('' if none). """
+    if not cp.isValid(): # ルールがマッチしなかった場合
+        return ''
+
+    if cp.TYPE in (TimexType.DATE, TimexType.TIME):
+        # 2年前 → Q-2Y
+        if len(cp.timedict) > 1 and TimeClass.FUN in cp.timedict \
+            and cp.get_timedata_before_finest().timetype != "DATE":
+            vfs = 'Q+' if cp.get_timedata('FUN').rel == 1 \
+                    else 'Q-' if cp.get_timedata('FUN').rel == -1 \
+                    else 'Q'
             for td in cp.timedict.values():
-                tc = td.timeclass
-                if tc == TimeClass.PHRASE:
-                    phrase = td.value
+                if td.timeclass in [TimeClass.FUN, TimeClass.MOD]:
                     continue
-                if Flag and (tc in [TimeClass.HOUR, TimeClass.MINUTE, TimeClass.SECOND]):
-                    vfs += 'T'
-                    Flag = False
-                if tc not in used_tcs and td.value:
-                    if tc in (TimeClass.NUM, TimeClass.FUN):
-                        continue
-                    if tc == TimeClass.FYEAR:
-                        vfs += f'{td.value}FY'
-                    else:
-                        vfs += f'{td.value}{tc[0]}'
-                    used_tcs.append(tc)
-            if vfs == '' and phrase:
-                vfs = phrase
-            if vfs == 'P' and cp.get_timedata('NUM').value: # FIXME とりあえずNUMはYearと見なす
-                vfs += f'{cp.get_timedata("NUM").value}Y'
+                if td.timeclass in (TimeClass.HOUR, TimeClass.MINUTE, TimeClass.SECOND):
+                    vfs += 'T'+td.value+td.timeclass[0]
+                else:
+                    vfs += td.value+td.timeclass[0]
+            return vfs
 
-            if vfs == 'P': # 正規化に失敗
-                vfs = 'None'
+        # XXXX-XX-XXTXX:XX:XX形式
+        # 各要素の値埋め
+        phrase = None
+        slots = [None]*6 # 6 slots
+        for td in cp.timedict.values():
+            tc = td.timeclass
+            if not td.timeclass:
+                continue
+            strnum = td.value
+            if tc == TimeClass.CENTURY and slots[0] is None:
+                slots[0] = 'XXXX' if td.ref \
+                    else f'{int(strnum)-1}XX' if strnum.isdigit() \
+                    else strnum
+            if tc == TimeClass.GYEAR and slots[0] is None:
+                slots[0] = strnum
+            elif tc == TimeClass.GYEARX and slots[0] is None:
+                slots[0] = f'{strnum[:-1]}X'
+            elif tc in (TimeClass.YEAR, TimeClass.YEARX) and slots[0] is None:
+                if td.ref:
+                    slots[0] = 'XXXX'
+                elif len(strnum) <= 2: # 02年, 直前が平成XX年の場合はH02とする
+                    if prev_vfs.startswith('H') and strnum.isdigit():
+                        slots[0] = f'H{int(strnum):02}'
+                    elif prev_vfs.startswith('S') and strnum.isdigit():
+                        slots[0] = f'S{int(strnum):02}'
+                    else: 
+                        slots[0] = 'X'*(4-len(strnum))+strnum
+                else:
+                    slots[0] = strnum
+                if tc == TimeClass.YEARX:
+                    slots[0] = f'{slots[0][:-1]}X'
+            elif tc == TimeClass.GFYEAR and slots[0] is None:
+                slots[0] = f'FY{strnum}'
+            elif tc == TimeClass.FYEAR and slots[0] is None:
+                slots[0] = 'FYXXXX' if td.ref \
+                            else 'FY'+'X'*(4-len(strnum))+strnum if len(strnum) <= 2\
+                            else f'FY{strnum}'
+            elif tc in [TimeClass.MONTH, TimeClass.SEASON, TimeClass.YOUBI] and slots[1] is None:
+                slots[1] = 'XX' if strnum == 'X' or td.ref\
+                                else '0'*(2-len(strnum))+strnum
+            elif tc == TimeClass.WEEK and slots[1] is None:
+                slots[1] = 'WXX'
+            elif tc in [TimeClass.DAY, TimeClass.JUN] and slots[2] is None:
+                slots[2] = 'XX' if strnum == 'X' or td.ref\
+                                else '0'*(2-len(strnum))+strnum
+            elif tc == TimeClass.HOUR and slots[3] is None:
+                slots[3] = 'XX' if strnum == 'X' or td.ref\
+                            else '0'*(2-len(strnum))+strnum
+            elif tc == TimeClass.MINUTE and not slots[4]:
+                slots[4] = 'XX' if strnum == 'X' or td.ref\
+                            else '0'*(2-len(strnum))+strnum
+            elif tc == TimeClass.SECOND and not slots[5]:
+                slots[5] = 'XX' if strnum == 'X' or td.ref\
+                            else '0'*(2-len(strnum))+strnum
+            elif tc == TimeClass.PHRASE:
+                phrase = strnum
+
+        vfs = slots2format(slots)
+        if vfs == '' and phrase:
+            vfs = phrase
+        return vfs
+
+    elif cp.TYPE == TimexType.SET \
+        and cp.get_timedata(TimeClass.YOUBI).value: # 毎週火曜日 --> XXXX-WXX-2
+        return f'XXXX-{cp.get_timedata("YOUBI").value}'
+
+    else: # DURATION
+        vfs = 'P'
+        phrase = ''
+        Flag = True
+        used_tcs = [] # P16Y16Yみたいなことがないように
+        for td in cp.timedict.values():
+            tc = td.timeclass
+            if tc == TimeClass.PHRASE:
+                phrase = td.value
+                continue
+            if Flag and (tc in [TimeClass.HOUR, TimeClass.MINUTE, TimeClass.SECOND]):
+                vfs += 'T'
+                Flag = False
+            if tc not in used_tcs and td.value:
+                if tc in (TimeClass.NUM, TimeClass.FUN):
+                    continue
+                if tc == TimeClass.FYEAR:
+                    vfs += f'{td.value}FY'
+                else:
+                    vfs += f'{td.value}{tc[0]}'
+                used_tcs.append(tc)
+        if vfs == '' and phrase:
+            vfs = phrase
+        if vfs == 'P' and cp.get_timedata('NUM').value: # FIXME とりあえずNUMはYearと見なす
+            vfs += f'{cp.get_timedata("NUM").value}Y'
 
-            vfs_list[cpid] = vfs
-    return vfs_list
+        if vfs == 'P': # 正規化に失敗
+            vfs = 'None'
+        return vfs
 
 
 def slots2format(slots, ref_cp=None):
@@ -228,293 +333,363 @@ def slots2format(slots, ref_cp=None):
                     else f'XXT{vfs}' if i==2 \
                     else f'XX:{vfs}'
 
-    if vfs.split('-')[0].isdigit() and \
-        int(vfs.split('-')[0]) < 1868 and \
-        vfs.count('-') == 2:
+    year = vfs.split('-', 1)[0]
+    if year.isdigit() and int(year) < 1868 and vfs.count('-') == 2:
         vfs += 'Q' # 旧暦
     return vfs
 
 
-def get_ref_cp(ref2cp, ref=None):
-    if (ref == RefType.DCT or not ref2cp.get(RefType.REF)):
-        return ref2cp[RefType.DCT]
-    return ref2cp[RefType.REF]+ref2cp[RefType.DCT]
+def to_date(year, month, day):
+    """ Same as datetime.strptime(f'{year}-{month}-{day}', '%Y-%m-%d'), without the format parsing. """
+    if not (YEAR_RE.fullmatch(year) and MONTH_RE.fullmatch(month) and DAY_RE.fullmatch(day)):
+        raise ValueError(f"time data '{year}-{month}-{day}' does not match format '%Y-%m-%d'")
+    return date(int(year), int(month), int(day))
+
+
+def date2slots(d):
+    """ Same as d.strftime('%Y-%m-%d').split('-') """
+    return str(d.year), f'{d.month:02}', f'{d.day:02}'
 
 
-def calc_value(time_compositions, vfs_list, dct):
+def calc_value(time_compositions, vfs_list, dct, era_index=None, stats=None):
     """ Calculate value from valueFromSurface.
 
     Args:
         time_compositions (List[TimeComposition])
         vfs_list (List[str])
         dct (str)
+        era_index (EraIndex): Defaults to the one of gengo.json.
+        stats (Stats): Records the time of calc_value, if given.
 
     Returns:
         List[str]
     """
-    v_list = copy.deepcopy(vfs_list)
+    v_list = list(vfs_list)
+    if era_index is None:
+        era_index = load_era_index()
+
+    references = References(dct)
+    for cpid in range(len(time_compositions)):
+        timed(stats, 'calc_value', calc_value_at, cpid, time_compositions, v_list, references, era_index)
+        references.add(time_compositions[cpid], v_list[cpid])
+    return v_list
 
-    for cpid, cp in enumerate(time_compositions):
-        v = v_list[cpid]
-        if cp.TYPE in ('DURATION', 'SET'):
-            continue
 
-        # 平成/昭和の置換
-        if re.search('H(\d\d)', v): #平成
-            v = re.sub('H(\d\d)', str(int(re.search('H(\d\d)',v).group(1))+1988), v)
-        elif re.search('H(\d)X', v): #平成X年代
-            v = re.sub('H(\d)', str(int(re.search('H(\d)',v).group(1))+1988+5)[:-1], v)
-        elif re.search('S(\d\d)', v): #昭和
-            v = re.sub('S(\d\d)', str(int(re.search('S(\d\d)',v).group(1))+1925), v)
-        elif re.search('S(\d)X', v): #昭和X年代
-            v = re.sub('S(\d)', str(int(re.search('S(\d)',v).group(1))*10+1925+5)[:-1], v)
-
-        # 正規化済み
-        if re.match('\d\d[\dX]X', v) or ('X' not in v and not v.startswith('Q')):
-            v_list[cpid] = v
-            _, v_list = resolve_youbi(time_compositions, v_list, cpid, v=v)
-            continue
+def calc_value_at(cpid, time_compositions, v_list, references, era_index):
+    """ Calculate the value of time_compositions[cpid] into v_list[cpid].
 
-        # Finde REF
-        ref2cp = find_refs(cpid, time_compositions, v_list, dct)
+    v_list[cpid] holds its valueFromSurface, unless the previous one was
+    resolved with it (resolve_youbi). Only time_compositions[cpid+1] is
+    looked at besides cpid; the earlier ones are in references.
 
-        # 「N年前」の正規化
-        # 「お盆前」などは対象外
-        if len(cp.timedict) > 1 and TimeClass.FUN in cp.timedict \
-            and list(cp.timedict.values())[-2].timetype != "DATE":
-            val = ''
-            ref_cp = get_ref_cp(ref2cp)[0]
-            rel = cp.get_timedata('FUN').rel if cp.get_timedata('FUN').rel else 0
-            cp_min_tc = [td for td in cp.timedict.values() if td.timeclass != 'FUN'][-1].timeclass
-
-            # 「N週間前」→ WEEK情報をDAY情報に変換
-            if TimeClass.WEEK in cp.timedict and cp.timedict[TimeClass.WEEK].value.isdigit():
-                if TimeClass.DAY in cp.timedict:
-                    if cp.timedict[TimeClass.DAY].isdigit():
-                        cp.timedict[TimeClass.DAY].value += 7*int(cp.timedict[TimeClass.WEEK].value)
-                else:
-                    cp.timedict[TimeClass.DAY] = TimeData(
-                        timeclass=TimeClass.DAY,
-                        value=str(7*int(cp.timedict[TimeClass.WEEK].value)))
-
-            # Calc slots
-            slots = [None]*6
-            for i, tc in enumerate([TimeClass.YEAR, TimeClass.MONTH, TimeClass.DAY,
-                                    TimeClass.HOUR, TimeClass.MINUTE, TimeClass.SECOND]):
-                if not ref_cp.get_timedata(tc).value.isdigit() \
-                    and cp.get_timedata(tc).value != 'X':
-                    break
-                if cp.get_timedata(tc).value.isdigit():
-                    diff = int(cp.get_timedata(tc).value)*rel
-                    new_val = int(ref_cp.get_timedata(tc).value) + diff
-                    if tc == TimeClass.MONTH and (new_val < 1 or new_val > 12):
-                        slots[0] = str(int(slots[0]) + new_val//12)
-                        slots[1] = str(new_val%12)
-                        if len(slots[1]) == 1:
-                            slots[1] = f"0{slots[1]}"
-                    elif tc == TimeClass.DAY:
-                        ref_date = datetime(int(slots[0]), int(slots[1]), int(ref_cp.get_timedata(tc).value))
-                        new_date = ref_date + timedelta(days=diff)
-                        slots[0], slots[1], slots[2] = new_date.strftime('%Y-%m-%d').split('-')
-                    else: # FIXME HOUR/MINUTE/SECONDへの対応: ex.「100時間後」
-                        slots[i] = str(int(ref_cp.get_timedata(tc).value) + diff)
-                elif cp.get_timedata(tc).value == 'X':
-                    slots[i] = 'XXXX' if tc == TimeClass.YEAR else 'XX'
-                else:
-                    slots[i] = ref_cp.get_timedata(tc).value
+    Args:
+        cpid (int)
+        time_compositions (List[TimeComposition])
+        v_list (List[str])
+        references (References): Holding the TimeCompositions before cpid.
+        era_index (EraIndex)
+    """
+    cp = time_compositions[cpid]
+    v = v_list[cpid]
+    if cp.TYPE in ('DURATION', 'SET'):
+        return
+
+    # 平成/昭和の置換
+    v = era_index.expand_value(v)
+
+    # 正規化済み
+    if DECADE_RE.match(v) or ('X' not in v and not v.startswith('Q')):
+        v_list[cpid] = v
+        _, v_list = resolve_youbi(time_compositions, v_list, cpid, v=v)
+        return
+
+    # Finde REF
+    ref_cands = references.find(cp)
+
+    # 「N年前」の正規化
+    # 「お盆前」などは対象外
+    if len(cp.timedict) > 1 and TimeClass.FUN in cp.timedict \
+        and cp.get_timedata_before_finest().timetype != "DATE":
+        val = ''
+        ref_cp = ref_cands.first()
+        rel = cp.get_timedata('FUN').rel if cp.get_timedata('FUN').rel else 0
+        cp_min_tc = [td for td in cp.timedict.values() if td.timeclass != 'FUN'][-1].timeclass
+
+        # 「N週間前」→ WEEK情報をDAY情報に変換
+        if TimeClass.WEEK in cp.timedict and cp.timedict[TimeClass.WEEK].value.isdigit():
+            cp = time_compositions[cpid] = cp.copy()
+            if TimeClass.DAY in cp.timedict:
+                if cp.timedict[TimeClass.DAY].isdigit():
+                    cp.timedict[TimeClass.DAY].value += 7*int(cp.timedict[TimeClass.WEEK].value)
+            else:
+                cp.timedict[TimeClass.DAY] = TimeData(
+                    timeclass=TimeClass.DAY,
+                    value=str(7*int(cp.timedict[TimeClass.WEEK].value)))
 
-                if tc == cp_min_tc:
+        # Calc slots
+        slots = [None]*6
+        for i, tc in enumerate([TimeClass.YEAR, TimeClass.MONTH, TimeClass.DAY,
+                                TimeClass.HOUR, TimeClass.MINUTE, TimeClass.SECOND]):
+            if not ref_cp.get_timedata(tc).value.isdigit() \
+                and cp.get_timedata(tc).value != 'X':
+                break
+            if cp.get_timedata(tc).value.isdigit():
+                diff = int(cp.get_timedata(tc).value)*rel
+                new_val = int(ref_cp.get_timedata(tc).value) + diff
+                if tc == TimeClass.MONTH and (new_val < 1 or new_val > 12):
+                    slots[0] = str(int(slots[0]) + new_val//12)
+                    slots[1] = str(new_val%12)
+                    if len(slots[1]) == 1:
+                        slots[1] = f"0{slots[1]}"
+                elif tc == TimeClass.DAY:
+                    ref_date = date(int(slots[0]), int(slots[1]), int(ref_cp.get_timedata(tc).value))
+                    new_date = ref_date + timedelta(days=diff)
+                    slots[0], slots[1], slots[2] = date2slots(new_date)
+                else: # FIXME HOUR/MINUTE/SECONDへの対応: ex.「100時間後」
+                    slots[i] = str(int(ref_cp.get_timedata(tc).value) + diff)
+            elif cp.get_timedata(tc).value == 'X':
+                slots[i] = 'XXXX' if tc == TimeClass.YEAR else 'XX'
+            else:
+                slots[i] = ref_cp.get_timedata(tc).value
+
+            if tc == cp_min_tc:
+                break
+        v_list[cpid] = slots2format(slots)
+        return
+
+    # XXXX-XX-XXTXX:XX:XX形式
+    phrase = None
+    slots = [None]*6
+    for td in cp.timedict.values():
+        tc = td.timeclass
+        if tc == TimeClass.CENTURY and slots[0] is None:
+            if td.rel is not None:
+                ref_cp = ref_cands.first(td.ref)
+                ref_year = ref_cp.get_timedata(TimeClass.YEAR).value
+                if td.value.isdigit(): # 「前世紀」
+                    slots[0] = f'{int(ref_year[:2]) + td.rel*int(td.value)}XX'
+                elif td.rel == 0: # 「今年」
+                    slots[0] = f'{int(ref_year[:2])}XX'
+        elif tc in [TimeClass.GYEAR, TimeClass.GYEARX, TimeClass.YEAR,
+                    TimeClass.YEARX, TimeClass.FYEAR] \
+            and slots[0] is None:
+            ref_cp = ref_cands.first(td.ref)
+            ref_year = ref_cp.get_timedata(TimeClass.YEAR).value
+            if td.rel is not None:
+                if td.value.isdigit(): # 「昨年」「来年」
+                    slots[0] = str(int(ref_year) + td.rel*int(td.value))
+                elif td.rel == 0: # 「今年」
+                    slots[0] = ref_year
+            elif len(td.value) == 2: # 「02年」「30年代」
+                k1 = ref_year[:2] + td.value.replace('X','0')
+                k2 = str(int(ref_year[:2])+1) + td.value.replace('X','0')
+                k3 = str(int(ref_year[:2])-1) + td.value.replace('X','0')
+                ks = [k1,k2,k3]
+                diffs = [math.fabs(int(k)-int(ref_year)) for k in ks]
+                val = ks[diffs.index(min(diffs))] # 候補k1-k3の中で、refと一番近いものを選択
+                if 'X' in td.value:
+                    slots[0] = f'{val[:-1]}X'
+                else: # 「N年代」
+                    slots[0] = val
+            else: # 「2002年」
+                slots[0] = td.value
+            # 「X年度」
+            if slots[0] and tc == TimeClass.FYEAR:
+                slots[0] = f'FY{slots[0]}'
+
+        elif tc == TimeClass.WEEK and slots[1] is None:
+            slots[1] = 'WXX'
+
+        elif tc in (TimeClass.MONTH, TimeClass.SEASON, TimeClass.YOUBI) \
+            and slots[1] is None:
+            if td.value == 'X':
+                slots[1] = 'XX'   # "何月"が'0X'とならないように
+            elif td.timeclass == TimeClass.MONTH and td.ref: # 「先月」「今月」
+                for ref_cp in ref_cands.get(td.ref):
+                    ref_year = ref_cp.get_timedata(TimeClass.YEAR).value
+                    ref_month = ref_cp.get_timedata(TimeClass.MONTH).value
+                    if not (ref_year and ref_month): # MONTHスロットがない場合
+                        continue
+                    if td.rel == 0: # 「今月」
+                        slots[0] = ref_year
+                        slots[1] = f'{int(ref_month):02}'
+                    elif td.value.isdigit():
+                        m = int(ref_month) + td.rel*int(td.value)
+                        if m < 1 or m > 12:
+                            slots[0] = f'{int(ref_year)+m//12}'
+                            slots[1] = f'{m%12:02}'
+                        else:
+                            slots[1] = f'{m:02}'
+                            slots[0] = ref_year
                     break
-            v_list[cpid] = slots2format(slots)
-            continue
+                else: # DCTにMonthがない場合
+                    slots[1] = 'XX'
+            else:
+                slots[1] = '0'*(2-len(td.value))+td.value
 
-        # XXXX-XX-XXTXX:XX:XX形式
-        phrase = None
-        slots = [None]*6
-        for td in cp.timedict.values():
-            tc = td.timeclass
-            if tc == TimeClass.CENTURY and slots[0] is None:
-                if td.rel is not None:
-                    ref_cp = get_ref_cp(ref2cp, td.ref)[0]
+        elif tc in ['DAY'] and slots[2] is None:
+            if td.value == 'X':
+                slots[2] = 'XX'   
+            elif td.timeclass == 'DAY' and td.ref:
+                for ref_cp in ref_cands.get(td.ref):
                     ref_year = ref_cp.get_timedata(TimeClass.YEAR).value
-                    if td.value.isdigit(): # 「前世紀」
-                        slots[0] = f'{int(ref_year[:2]) + td.rel*int(td.value)}XX'
-                    elif td.rel == 0: # 「今年」
-                        slots[0] = f'{int(ref_year[:2])}XX'
-            elif tc in [TimeClass.GYEAR, TimeClass.GYEARX, TimeClass.YEAR,
-                        TimeClass.YEARX, TimeClass.FYEAR] \
-                and slots[0] is None:
-                ref_cp = get_ref_cp(ref2cp, td.ref)[0]
-                ref_year = ref_cp.get_timedata(TimeClass.YEAR).value
-                if td.rel is not None:
-                    if td.value.isdigit(): # 「昨年」「来年」
-                        slots[0] = str(int(ref_year) + td.rel*int(td.value))
-                    elif td.rel == 0: # 「今年」
+                    ref_month = ref_cp.get_timedata(TimeClass.MONTH).value
+                    ref_day = ref_cp.get_timedata(TimeClass.DAY).value
+                    if not (ref_year and ref_month and ref_day): # DAYスロットがない場合
+                        continue
+                    if td.rel == 0: # 今日
                         slots[0] = ref_year
-                elif len(td.value) == 2: # 「02年」「30年代」
-                    k1 = ref_year[:2] + td.value.replace('X','0')
-                    k2 = str(int(ref_year[:2])+1) + td.value.replace('X','0')
-                    k3 = str(int(ref_year[:2])-1) + td.value.replace('X','0')
-                    ks = [k1,k2,k3]
-                    diffs = [math.fabs(int(k)-int(ref_year)) for k in ks]
-                    val = ks[diffs.index(min(diffs))] # 候補k1-k3の中で、refと一番近いものを選択
-                    if 'X' in td.value:
-                        slots[0] = f'{val[:-1]}X'
-                    else: # 「N年代」
-                        slots[0] = val
-                else: # 「2002年」
-                    slots[0] = td.value
-                # 「X年度」
-                if slots[0] and tc == TimeClass.FYEAR:
-                    slots[0] = f'FY{slots[0]}'
+                        slots[1] = ref_month
+                        slots[2] = f'{int(ref_day):02}'
+                    elif td.value.isdigit():
+                        diff_day = td.rel*int(td.value)
+                        ref_date = to_date(ref_year, ref_month, ref_day)
+                        new_date = ref_date + timedelta(days=diff_day)
+                        slots[0],slots[1],slots[2] = date2slots(new_date)
+                    break
+                else:
+                    slots[2] = 'XX'
+            else:
+                slots[2] = '0'*(2-len(td.value))+td.value
 
-            elif tc == TimeClass.WEEK and slots[1] is None:
-                slots[1] = 'WXX'
+        elif tc == TimeClass.JUN and slots[2] is None:
+            slots[2] = 'XX' if td.value == 'X' or td.ref \
+                        else '0'*(2-len(td.value))+td.value
 
-            elif tc in (TimeClass.MONTH, TimeClass.SEASON, TimeClass.YOUBI) \
-                and slots[1] is None:
-                if td.value == 'X':
-                    slots[1] = 'XX'   # "何月"が'0X'とならないように
-                elif td.timeclass == TimeClass.MONTH and td.ref: # 「先月」「今月」
-                    for ref_cp in get_ref_cp(ref2cp, td.ref):
-                        ref_year = ref_cp.get_timedata(TimeClass.YEAR).value
-                        ref_month = ref_cp.get_timedata(TimeClass.MONTH).value
-                        if not (ref_year and ref_month): # MONTHスロットがない場合
-                            continue
-                        if td.rel == 0: # 「今月」
-                            slots[0] = ref_year
-                            slots[1] = f'{int(ref_month):02}'
-                        elif td.value.isdigit():
-                            m = int(ref_month) + td.rel*int(td.value)
-                            if m < 1 or m > 12:
-                                slots[0] = f'{int(ref_year)+m//12}'
-                                slots[1] = f'{m%12:02}'
-                            else:
-                                slots[1] = f'{m:02}'
-                                slots[0] = ref_year
-                        break
-                    else: # DCTにMonthがない場合
-                        slots[1] = 'XX'
-                else:
-                    slots[1] = '0'*(2-len(td.value))+td.value
-
-            elif tc in ['DAY'] and slots[2] is None:
-                if td.value == 'X':
-                    slots[2] = 'XX'   
-                elif td.timeclass == 'DAY' and td.ref:
-                    for ref_cp in get_ref_cp(ref2cp, td.ref):
-                        ref_year = ref_cp.get_timedata(TimeClass.YEAR).value
-                        ref_month = ref_cp.get_timedata(TimeClass.MONTH).value
-                        ref_day = ref_cp.get_timedata(TimeClass.DAY).value
-                        if not (ref_year and ref_month and ref_day): # DAYスロットがない場合
-                            continue
-                        if td.rel == 0: # 今日
-                            slots[0] = ref_year
-                            slots[1] = ref_month
-                            slots[2] = f'{int(ref_day):02}'
-                        elif td.value.isdigit():
-                            diff_day = td.rel*int(td.value)
-                            ref_date = datetime.strptime(f'{ref_year}-{ref_month}-{ref_day}', '%Y-%m-%d')
-                            new_date = ref_date + timedelta(days=diff_day)
-                            slots[0],slots[1],slots[2] = new_date.strftime('%Y-%m-%d').split('-')
-                        break
-                    else:
-                        slots[2] = 'XX'
-                else:
-                    slots[2] = '0'*(2-len(td.value))+td.value
+        elif tc == TimeClass.HOUR and slots[3] is None:
+            if td.value == 'X':
+                slots[3] = 'XX'
+            else:
+                strnum = td.value
+                if td.value.isdigit() and int(td.value) >= 24:
+                    strnum = str(int(strnum)-24)
+                slots[3] = '0'*(2-len(strnum))+strnum
 
-            elif tc == TimeClass.JUN and slots[2] is None:
-                slots[2] = 'XX' if td.value == 'X' or td.ref \
-                            else '0'*(2-len(td.value))+td.value
+        elif tc == TimeClass.MINUTE and slots[4] is None:
+            slots[4] = 'XX' if td.value == 'X' \
+                        else '0'*(2-len(td.value))+td.value
 
-            elif tc == TimeClass.HOUR and slots[3] is None:
-                if td.value == 'X':
-                    slots[3] = 'XX'
-                else:
-                    strnum = td.value
-                    if td.value.isdigit() and int(td.value) >= 24:
-                        strnum = str(int(strnum)-24)
-                    slots[3] = '0'*(2-len(strnum))+strnum
+        elif tc == TimeClass.SECOND and slots[5] is None:
+            slots[5] = 'XX' if td.value == 'X' \
+                        else '0'*(2-len(td.value))+td.value
 
-            elif tc == TimeClass.MINUTE and slots[4] is None:
-                slots[4] = 'XX' if td.value == 'X' \
-                            else '0'*(2-len(td.value))+td.value
+        elif tc == 'PHRASE':
+            phrase = td.value
 
-            elif tc == TimeClass.SECOND and slots[5] is None:
-                slots[5] = 'XX' if td.value == 'X' \
-                            else '0'*(2-len(td.value))+td.value
+    resolvedFlag, v_list = resolve_youbi(time_compositions, v_list, cpid,
+                                         ref_cands=ref_cands, slots=slots)
+    if not resolvedFlag:
+        v = phrase if phrase and all(x is None for x in slots)\
+                else slots2format(slots, ref_cands.first())
+        v_list[cpid] = v
 
-            elif tc == 'PHRASE':
-                phrase = td.value
 
-        resolvedFlag, v_list = resolve_youbi(time_compositions, v_list, cpid,
-                                             ref2cp=ref2cp, slots=slots)
-        if not resolvedFlag:
-            v = phrase if phrase and all(x is None for x in slots)\
-                    else slots2format(slots, get_ref_cp(ref2cp)[0])
-            v_list[cpid] = v
-    return v_list
+TC_YMD = (TimeClass.YEAR, TimeClass.MONTH, TimeClass.DAY)
+TC_HMS = (TimeClass.HOUR, TimeClass.MINUTE, TimeClass.SECOND)
 
 
-def find_refs(cpid, time_compositions, v_list, dct):
+class RefCandidates(namedtuple('RefCandidates', ('refs', 'dct_cp'))):
+    """ Candidates of the reference of a timex: the preceding timexes as a
+    linked list of RefNode, nearest first, then the DCT.
     """
-    Returns:
-        Dict[str, List[]]
-    """
-    cp = time_compositions[cpid]
-    ref2cp = defaultdict(list) # {"DCT": [dct_cp],  "REF": [ref_cp]}
-    tc_ymd = (TimeClass.YEAR, TimeClass.MONTH, TimeClass.DAY)
-    tc_hms = (TimeClass.HOUR, TimeClass.MINUTE, TimeClass.SECOND)
-
-    # Add DCT
-    dct_cp = TimeComposition(TimexType.DATE)
-    dct_ymd = dct.split('T')[0].split('-')
-    for tc, val in zip(tc_ymd, dct_ymd):
-        dct_cp.add(TimeData(timeclass=tc, value=val))
-    ref2cp[RefType.DCT].append(dct_cp)
-
-    # Add refs
-    # FIXME どのようにREFを選択するか
-    for i in range(cpid-1,-1,-1):
-        bef_cp = time_compositions[i]
-        bef_v = v_list[i]
-        if bef_cp.sent_id == cp.sent_id: # 同じ文で先に出現したDATE/TIMEをREFとする
-            if bef_cp.TYPE in (TimexType.DATE, TimexType.TIME):
-                ref_cp = TimeComposition(TimexType.DATE)
-                for tc,val in zip(tc_ymd, bef_v.split('T')[0].split('-')):
-                    if val.isdigit():
-                        ref_cp.add(TimeData(timeclass=tc, value=val))
-                    elif re.match('FY\d+', val):
-                        ref_cp.add(TimeData(timeclass=tc, value=val[2:]))
-                    else:
-                        break
-                if ref_cp.isValid():
-                    if 'T' in bef_v:
-                        for tc,val in zip(tc_hms, bef_v.split('T')[1].split(':')):
-                            if val.isdigit():
-                                ref_cp.add(TimeData(timeclass=tc, value=val))
-                            else:
-                                break
-                    ref2cp[RefType.REF].append(ref_cp)
-        elif not ref2cp[RefType.REF] and i == cpid-1 and \
-                any(td.ref==RefType.REF for td in cp.timedict.values()): # 文の先頭でかつrelationなとき
-            if bef_cp.TYPE not in (TimexType.DATE, TimexType.TIME) or \
-                len(list(bef_cp.timedict)) == 0 or \
-                cp.sent_id-bef_cp.sent_id > 1:
+    def get(self, ref=None):
+        """ Yields the candidates, only the DCT if ref is DCT or there are no refs. """
+        if ref != RefType.DCT:
+            node = self.refs
+            while node is not None:
+                yield node.ref_cp
+                node = node.rest
+        yield self.dct_cp
+
+    def first(self, ref=None):
+        if ref == RefType.DCT or self.refs is None:
+            return self.dct_cp
+        return self.refs.ref_cp
+
+
+class RefNode(object):
+    """ The value of a preceding timex, parsed into a TimeComposition on first use. """
+    __slots__ = ('v', 'rest', '_ref_cp')
+
+    def __init__(self, v, rest, ref_cp=None):
+        self.v = v
+        self.rest = rest # RefNode of the timex before, or None
+        self._ref_cp = ref_cp
+
+    @property
+    def ref_cp(self):
+        if self._ref_cp is None:
+            self._ref_cp = parse_ref(self.v)
+        return self._ref_cp
+
+
+def parse_ref(v):
+    """ TimeComposition of the date and time in the value v (2019-06-24T10:00) """
+    ref_cp = TimeComposition(TimexType.DATE)
+    for tc,val in zip(TC_YMD, v.split('T')[0].split('-')):
+        if val.isdigit():
+            ref_cp.add(TimeData(timeclass=tc, value=val))
+        elif FY_RE.match(val):
+            ref_cp.add(TimeData(timeclass=tc, value=val[2:]))
+        else:
+            break
+    if ref_cp.isValid() and 'T' in v:
+        for tc,val in zip(TC_HMS, v.split('T')[1].split(':')):
+            if val.isdigit():
+                ref_cp.add(TimeData(timeclass=tc, value=val))
+            else:
                 break
+    return ref_cp
+
+
+class References(object):
+    """ References of the timexes of a document, updated one timex at a time.
+
+    The DCT is parsed once. The DATE/TIME timexes earlier in the same
+    sentence are kept as a linked list, nearest first, so the candidates of
+    a timex are found in constant time. Their values are parsed only when
+    they are used.
+    """
+    def __init__(self, dct):
+        self.dct_cp = TimeComposition(TimexType.DATE)
+        for tc, val in zip(TC_YMD, dct.split('T')[0].split('-')):
+            self.dct_cp.add(TimeData(timeclass=tc, value=val))
+        self.sent_refs = None # RefNode of the current sentence
+        self.prev_cp = None # The last TimeComposition added, and its value
+        self.prev_v = None
+
+    def find(self, cp):
+        """ Returns the RefCandidates of cp, which follows the TimeCompositions added so far. """
+        prev_cp = self.prev_cp
+        if prev_cp is None:
+            return RefCandidates(None, self.dct_cp)
+        # FIXME どのようにREFを選択するか
+        if prev_cp.sent_id == cp.sent_id: # 同じ文で先に出現したDATE/TIMEをREFとする
+            return RefCandidates(self.sent_refs, self.dct_cp)
+        if any(td.ref==RefType.REF for td in cp.timedict.values()) \
+            and prev_cp.TYPE in (TimexType.DATE, TimexType.TIME) \
+            and len(prev_cp.timedict) != 0 \
+            and cp.sent_id-prev_cp.sent_id <= 1: # 文の先頭でかつrelationなとき
             ref_cp = TimeComposition(TimexType.DATE)
-            for tc,val in zip(tc_ymd, bef_v.split('T')[0].split('-')):
+            for tc,val in zip(TC_YMD, self.prev_v.split('T')[0].split('-')):
                 if val.isdigit():
                     ref_cp.add(TimeData(timeclass=tc, value=val))
             if ref_cp.isValid():
-                ref2cp[RefType.REF].append(ref_cp)
-            break
-        else:
-            break
-    return ref2cp
+                return RefCandidates(RefNode(self.prev_v, None, ref_cp), self.dct_cp)
+        return RefCandidates(None, self.dct_cp)
+
+    def add(self, cp, v):
+        """ Add the next TimeComposition, whose value v is final. """
+        if self.prev_cp is None or self.prev_cp.sent_id != cp.sent_id:
+            self.sent_refs = None
+        self.prev_cp, self.prev_v = cp, v
+        if cp.TYPE in (TimexType.DATE, TimexType.TIME):
+            year = v.split('T', 1)[0].split('-', 1)[0]
+            if year.isdigit() or FY_RE.match(year): # parse_ref(v).isValid()
+                self.sent_refs = RefNode(v, self.sent_refs)
 
 
-def resolve_youbi(time_compositions, v_list, cpid, v=None, ref2cp=None, slots=None):
+def resolve_youbi(time_compositions, v_list, cpid, v=None, ref_cands=None, slots=None):
     """ Complement successive date and youbi information.
 
     Returns:
@@ -531,13 +706,14 @@ def resolve_youbi(time_compositions, v_list, cpid, v=None, ref2cp=None, slots=No
             v_list[cpid] = v
             v_list[cpid+1] = v
             return True, v_list
-        elif ref2cp and slots:
-            for ref_cp in get_ref_cp(ref2cp):
+        elif ref_cands and slots:
+            youbi = next_cp.get_timedata(TimeClass.YOUBI).value
+            for ref_cp in ref_cands.get():
                 tmp_v = slots2format(slots, ref_cp)
-                date = tmp_v.split('T')[0]
-                if len(date.split('-')) == 3 and \
-                    all(x.isdigit() for x in date.split('-')) and \
-                    f'WXX-{datetime.strptime(date,"%Y-%m-%d").weekday()+1}' == f'{next_cp.get_timedata("YOUBI").value}':
+                ymd = tmp_v.split('T', 1)[0].split('-')
+                if len(ymd) == 3 and \
+                    all(x.isdigit() for x in ymd) and \
+                    f'WXX-{to_date(*ymd).weekday()+1}' == youbi:
                     v = tmp_v
                     v_list[cpid] = v
                     v_list[cpid+1] = v
@@ -549,46 +725,85 @@ def resolve_parallel(time_compositions):
     """
         並列処理 ex. 17、18日
     """
-    for cpid, cp in reversed(list(enumerate(time_compositions[:-1]))):
-        if cp.isValid() \
-            and all(td.timeclass == TimeClass.NUM for td in cp.timedict.values()) \
-            and time_compositions[cpid+1].sent_id == cp.sent_id \
-            and time_compositions[cpid+1].begin_strid-cp.end_strid == 1 \
-            and len(list(time_compositions[cpid+1].timedict.values()))==1:
-            tc = list(time_compositions[cpid+1].timedict.values())[0].timeclass
-            new_cp = TimeComposition(cp.TYPE, cp.begin_strid, cp.end_strid)
-            if tc.endswith('X'): # YEARX
-                new_cp.add(
-                    TimeData(timeclass=tc,
-                             value=f'{cp.get_timedata(TimeClass.NUM).value[:-1]}X'))
-            else:
-                new_cp.add(
-                    TimeData(timeclass=tc,
-                             value=cp.get_timedata(TimeClass.NUM).value))
-            time_compositions[cpid] = new_cp
+    for cpid in reversed(range(len(time_compositions)-1)):
+        time_compositions[cpid] = merge_parallel(time_compositions[cpid], time_compositions[cpid+1])
     return time_compositions
 
 
+def iter_parallel(time_compositions):
+    """ Same as resolve_parallel, one TimeComposition at a time.
+
+    A number (「17、」) is merged with the next TimeComposition after that is
+    itself merged, so a run of numbers is kept until what follows it is known.
+    """
+    numbers = [] # Run of numbers waiting for the next TimeComposition
+    for cp in time_compositions:
+        if is_number(cp):
+            numbers.append(cp)
+            continue
+        yield from merge_numbers(numbers, cp)
+        numbers = []
+        yield cp
+    if numbers:
+        yield from merge_numbers(numbers[:-1], numbers[-1])
+        yield numbers[-1]
+
+
+def merge_numbers(numbers, next_cp):
+    for i in reversed(range(len(numbers))):
+        next_cp = numbers[i] = merge_parallel(numbers[i], next_cp)
+    return numbers
+
+
+def is_number(cp):
+    return cp.isValid() and all(td.timeclass == TimeClass.NUM for td in cp.timedict.values())
+
+
+def merge_parallel(cp, next_cp):
+    """ Returns cp with the timeclass of next_cp if cp is a number in parallel with it. """
+    if is_number(cp) \
+        and next_cp.sent_id == cp.sent_id \
+        and next_cp.begin_strid-cp.end_strid == 1 \
+        and len(next_cp.timedict)==1:
+        tc = next(iter(next_cp.timedict.values())).timeclass
+        new_cp = TimeComposition(cp.TYPE, cp.begin_strid, cp.end_strid)
+        if tc.endswith('X'): # YEARX
+            new_cp.add(
+                TimeData(timeclass=tc,
+                         value=f'{cp.get_timedata(TimeClass.NUM).value[:-1]}X'))
+        else:
+            new_cp.add(
+                TimeData(timeclass=tc,
+                         value=cp.get_timedata(TimeClass.NUM).value))
+        return new_cp
+    return cp
+
+
 def resolve_functions(time_compositions):
     """
         FUNCTION (ex. 半日) の0.5倍の処理
     """
     for cpid, cp in enumerate(time_compositions):
-        if cp.TYPE in (TimexType.DURATION, TimexType.SET) \
-            and cp.get_timedata('FUN').value == '0.5' \
-            and all(td.value.isdigit() for td in cp.timedict.values()
-                    if td.timeclass != 'FUN'):
-            new_cp = TimeComposition(
-                cp.TYPE, begin_strid=cp.begin_strid, end_strid=cp.end_strid)
-            for td in cp.timedict.values():
-                if td.timeclass == 'FUN':
-                    continue
-                val = float(cp.get_timedata(td.timeclass).value)/2
-                if val.is_integer(): # 整数
-                    new_cp.add(
-                        TimeData(timeclass=td.timeclass, value=str(int(val))))
-                else:
-                    new_cp.add(
-                        TimeData(timeclass=td.timeclass, value=f'{val:.1f}'))
-            time_compositions[cpid] = new_cp
+        time_compositions[cpid] = resolve_function(cp)
     return time_compositions
+
+
+def resolve_function(cp):
+    if cp.TYPE in (TimexType.DURATION, TimexType.SET) \
+        and cp.get_timedata('FUN').value == '0.5' \
+        and all(td.value.isdigit() for td in cp.timedict.values()
+                if td.timeclass != 'FUN'):
+        new_cp = TimeComposition(
+            cp.TYPE, begin_strid=cp.begin_strid, end_strid=cp.end_strid)
+        for td in cp.timedict.values():
+            if td.timeclass == 'FUN':
+                continue
+            val = float(cp.get_timedata(td.timeclass).value)/2
+            if val.is_integer(): # 整数
+                new_cp.add(
+                    TimeData(timeclass=td.timeclass, value=str(int(val))))
+            else:
+                new_cp.add(
+                    TimeData(timeclass=td.timeclass, value=f'{val:.1f}'))
+        return new_cp
+    return cp
@@ -4,5 +4,6 @@ setup(
     name="normtime",
     version="0.0.1",
     packages=find_packages(),
-    data_files=[("rule", ["./rule/gengo.json", "./rule/strRule.json"])]
+    data_files=[("rule", ["./rule/gengo.json", "./rule/strRule.json"])],
+    entry_points={"console_scripts": ["normtime = normtime.cli:main"]},
 )
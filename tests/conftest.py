@@ -0,0 +1,5 @@
+import os
+import sys
+HERE = os.path.dirname(os.path.realpath(__file__))
+sys.path.insert(0, f'{HERE}/..')
+sys.path.insert(0, f'{HERE}/../tools')
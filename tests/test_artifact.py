@@ -0,0 +1,22 @@
+import shutil
+
+from normtime.artifact import load_artifact, write_artifact
+from normtime.rule import RULE_FILE, GENGO_FILE, compile_rules
+
+
+def test_artifact_is_ignored_when_the_rule_files_change(tmp_path):
+    rule_file = tmp_path / 'strRule.json'
+    shutil.copy(RULE_FILE, rule_file)
+    sources = (str(rule_file), GENGO_FILE)
+    artifact = str(tmp_path / 'compiled_rules.pickle')
+    write_artifact(artifact, compile_rules(str(rule_file), GENGO_FILE, with_scanner=False), sources)
+    loaded = load_artifact(artifact, sources)
+    assert loaded is not None
+
+    # Same content, different path and mtime: still loaded
+    shutil.copy(rule_file, tmp_path / 'copy.json')
+    assert load_artifact(artifact, (str(tmp_path / 'copy.json'), GENGO_FILE)) is not None
+
+    with open(rule_file, 'a', encoding='utf-8') as f:
+        f.write('\n')
+    assert load_artifact(artifact, sources) is None
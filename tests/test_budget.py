@@ -0,0 +1,71 @@
+import sys
+import logging
+import pytest
+from normtime import NormTime, TIMEX
+from normtime.rule import ApplyRule
+
+DCT = '2013-06-01'
+
+
+def single_timex(text, TYPE='DATE'):
+    return [(text, [TIMEX(str=text, begin_strid=0, end_strid=len(text), TYPE=TYPE)])]
+
+
+def budget_records(caplog):
+    return [record for record in caplog.records
+            if record.name == 'normtime.rule' and record.levelno == logging.WARNING]
+
+
+@pytest.fixture(scope='module')
+def apply_rule():
+    return ApplyRule(False, max_seconds=1.0)
+
+
+def test_no_timex_is_not_an_overrun(apply_rule, caplog):
+    sentence = '今日は雨。'
+    with caplog.at_level(logging.WARNING, logger='normtime.rule'):
+        assert apply_rule.matching_rule(apply_rule.mask_sent(sentence, []), []) == []
+    assert apply_rule.budget_exceeded == {'chars': 0, 'matches': 0, 'chains': 0, 'seconds': 0}
+    assert budget_records(caplog) == []
+
+
+def test_document_without_overrun(caplog):
+    nt = NormTime(stats=True, max_seconds=1.0)
+    doc = [('今日は雨。', []),
+           ('来年4/26に会う。', [TIMEX(str='来年4/26', begin_strid=0, end_strid=6, TYPE='DATE')]),
+           ('晴れ。', [])]
+    with caplog.at_level(logging.WARNING, logger='normtime.rule'):
+        assert list(nt.normalize(doc, DCT)) == [('XXXX-04-26', '2014-04-26')]
+    assert sum(nt.apply_rule.budget_exceeded.values()) == 0
+    assert nt.stats.snapshot()['counters']['budget_exceeded'] == 0
+    assert budget_records(caplog) == []
+
+
+def test_max_matches_leaves_timex_unnormalized(caplog):
+    nt = NormTime(max_matches=1)
+    with caplog.at_level(logging.WARNING, logger='normtime.rule'):
+        assert list(nt.normalize(single_timex('2013年6月1日'), DCT)) == [('', '')]
+    assert nt.apply_rule.budget_exceeded['matches'] == 1
+    records = budget_records(caplog)
+    assert len(records) == 1 and 'matches' in records[0].getMessage()
+
+
+@pytest.mark.parametrize('matcher', ['loop', 'scanner'])
+def test_max_timex_chars(matcher, caplog):
+    nt = NormTime(matcher=matcher, max_timex_chars=256, max_seconds=0.05)
+    doc = single_timex('1'*20000 + '年') + single_timex('来年4/26')
+    with caplog.at_level(logging.WARNING, logger='normtime.rule'):
+        assert list(nt.normalize(doc, DCT)) == [('', ''), ('XXXX-04-26', '2014-04-26')]
+    assert nt.apply_rule.budget_exceeded['chars'] == 1
+    assert [record.getMessage() for record in budget_records(caplog)] == \
+        ['Work budget of a TIMEX exceeded: chars']
+
+
+@pytest.mark.skipif(not hasattr(sys, 'get_int_max_str_digits'), reason="no int() digit limit")
+def test_long_number_is_over_budget(caplog):
+    # The scanner matches the run at once; its number is longer than int() converts
+    nt = NormTime(matcher='scanner', max_seconds=0.05)
+    with caplog.at_level(logging.WARNING, logger='normtime.rule'):
+        assert list(nt.normalize(single_timex('1'*20000 + '年'), DCT)) == [('', '')]
+    assert sum(nt.apply_rule.budget_exceeded.values()) >= 1
+    assert budget_records(caplog)
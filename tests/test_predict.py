@@ -0,0 +1,29 @@
+import json
+import pytest
+from normtime.cli import main
+
+DOC = {'dct': '2019-06-24', 'sentences': [
+    {'sentence': '20時に出る。5時間後に会う。', 'spans': [[0, 3, 'TIME'], [7, 11, 'TIME']]}]}
+RESULTS = [['XXXX-XX-XXT20', '2019-06-24T20'], ['Q+T5H', '2019-06-24T25']]
+
+
+@pytest.mark.parametrize('processes', [1, 2])
+def test_malformed_lines_in_the_middle(tmp_path, processes):
+    lines = [json.dumps(dict(DOC, id=1)),
+             json.dumps({'id': 2, 'sentences': [{'sentence': '明日', 'spans': 5}]}),
+             json.dumps({'id': 3, 'sentences': [{'sentence': '明日', 'spans': None}]}),
+             'not json',
+             '[' * 100000, # RecursionError, not a ValueError
+             json.dumps(dict(DOC, id=6))]
+    input_file = tmp_path / 'input.jsonl'
+    output_file = tmp_path / 'output.jsonl'
+    input_file.write_text('\n'.join(lines) + '\n', encoding='utf-8')
+
+    main(['predict', str(input_file), '-o', str(output_file), '--processes', str(processes)])
+
+    records = [json.loads(line) for line in output_file.read_text(encoding='utf-8').splitlines()]
+    assert len(records) == len(lines)
+    assert records[0] == {'id': 1, 'results': RESULTS}
+    assert [record.get('id') for record in records[1:5]] == [2, 3, None, None]
+    assert all('error' in record and 'results' not in record for record in records[1:5])
+    assert records[5] == {'id': 6, 'results': RESULTS}
@@ -0,0 +1,104 @@
+import json
+import threading
+import http.client
+from concurrent.futures import Future, ThreadPoolExecutor
+import pytest
+from normtime.server import MicroBatcher, NormTimeHandler, NormTimeServer, Overloaded
+
+DOC = {'dct': '2013-06-01', 'sentences': [{'sentence': '来年4/26に会う。', 'spans': [[0, 6, 'DATE']]}]}
+
+
+def start_server(batcher, request_queue_size=1024, **handler_attrs):
+    handler = type('Handler', (NormTimeHandler,), dict(handler_attrs, batcher=batcher))
+    httpd = NormTimeServer(('127.0.0.1', 0), handler, request_queue_size)
+    threading.Thread(target=httpd.serve_forever, daemon=True).start()
+    return httpd
+
+
+@pytest.fixture(scope='module')
+def server():
+    batcher = MicroBatcher(workers=0)
+    httpd = start_server(batcher)
+    yield httpd
+    httpd.shutdown()
+    httpd.server_close()
+    batcher.close()
+
+
+def post(httpd, obj):
+    conn = http.client.HTTPConnection('127.0.0.1', httpd.server_port, timeout=10)
+    try:
+        conn.request('POST', '/normalize', body=json.dumps(obj).encode('utf-8'))
+        response = conn.getresponse()
+        return response.status, json.loads(response.read())
+    finally:
+        conn.close()
+
+
+def test_normalize(server):
+    status, body = post(server, DOC)
+    assert status == 200
+    assert body == {'results': [['XXXX-04-26', '2014-04-26']]}
+
+
+@pytest.mark.parametrize('spans', [5, None, 'ab', [[0]], [5], [[0, 99]], [[0, 2, 'YEAR']]])
+def test_malformed_spans(server, spans):
+    status, body = post(server, {'sentences': [{'sentence': '来年4/26に会う。', 'spans': spans}]})
+    assert status == 400
+    assert 'error' in body
+
+
+@pytest.mark.parametrize('dct', ['abc', '2013-6-1', '2013-02-30', '20130601', 20130601])
+def test_malformed_dct(server, dct):
+    status, body = post(server, dict(DOC, dct=dct))
+    assert status == 400
+    assert 'dct' in body['error']
+
+
+def test_dct_with_time(server):
+    assert post(server, dict(DOC, dct='2013-06-01T10:00'))[0] == 200
+
+
+def test_concurrent_clients(server):
+    """ Bursts of clients wait to be accepted and are all answered """
+    with ThreadPoolExecutor(64) as executor:
+        statuses = list(executor.map(lambda _: post(server, DOC)[0], range(320)))
+    assert set(statuses) <= {200, 503}
+    assert statuses.count(200) > 0
+
+
+def test_timeout():
+    class StuckBatcher(object):
+        def submit(self, doc, dct):
+            return Future() # never done
+
+    httpd = start_server(StuckBatcher(), timeout_sec=0.1)
+    try:
+        status, body = post(httpd, DOC)
+    finally:
+        httpd.shutdown()
+        httpd.server_close()
+    assert status == 503
+    assert body['error']
+
+
+def test_overloaded():
+    class FullBatcher(object):
+        def submit(self, doc, dct):
+            raise Overloaded('1 documents are waiting')
+
+    httpd = start_server(FullBatcher())
+    try:
+        status, body = post(httpd, {'sentences': [{'sentence': '明日', 'spans': [[0, 2]]}]})
+    finally:
+        httpd.shutdown()
+        httpd.server_close()
+    assert status == 503
+
+
+def test_queue_is_bounded():
+    batcher = MicroBatcher(workers=0, max_queue=1)
+    batcher.close() # nothing takes the documents from the queue any more
+    batcher.submit([], '2013-06-01')
+    with pytest.raises(Overloaded):
+        batcher.submit([], '2013-06-01')
@@ -0,0 +1,20 @@
+from normtime import NormTime, TIMEX
+
+
+def test_reset_clears_the_str2num_cache_counts():
+    nt = NormTime(stats=True)
+    text = '2013年6月1日'
+    doc = [(text, [TIMEX(str=text, begin_strid=0, end_strid=len(text), TYPE='DATE')])]
+    list(nt.normalize(doc, '2013-06-01'))
+    cache = nt.stats.snapshot()['str2num_cache']
+    assert cache['hits'] + cache['misses'] > 0
+
+    nt.stats.reset()
+    snapshot = nt.stats.snapshot()
+    assert snapshot['counters']['timexes'] == 0
+    assert snapshot['str2num_cache']['hits'] == snapshot['str2num_cache']['misses'] == 0
+    assert snapshot['str2num_cache']['hit_rate'] == 0.0
+
+    list(nt.normalize(doc, '2013-06-01'))
+    cache = nt.stats.snapshot()['str2num_cache']
+    assert cache['misses'] == 0 and cache['hits'] > 0 # the numbers are cached by now
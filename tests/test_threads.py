@@ -0,0 +1,61 @@
+import random
+import threading
+from concurrent.futures import ThreadPoolExecutor
+import pytest
+import normtime
+from normtime import NormTime, get_engine, reset_engine
+from sample_docs import EXPRESSIONS, make_docs, normalize_one
+
+N_THREADS = 8
+
+
+def run_threads(func, n_threads=N_THREADS):
+    """ func(thread index) on n_threads threads started at once """
+    start = threading.Barrier(n_threads)
+
+    def worker(i):
+        start.wait()
+        return func(i)
+
+    with ThreadPoolExecutor(n_threads) as executor:
+        return list(executor.map(worker, range(n_threads)))
+
+
+@pytest.mark.parametrize('matcher', ['loop', 'scanner'])
+def test_shared_normtime(matcher):
+    nt = NormTime(matcher=matcher)
+    docs = make_docs(100)
+    expected = [normalize_one(nt, doc, dct) for doc, dct in docs]
+
+    def worker(seed):
+        order = list(range(len(docs)))
+        random.Random(seed).shuffle(order)
+        return {i: normalize_one(nt, *docs[i]) for i in order}
+
+    for results in run_threads(worker):
+        assert [results[i] for i in range(len(docs))] == expected
+
+
+def test_shared_stats():
+    nt = NormTime(stats=True)
+    docs = make_docs(50)
+    for doc, dct in docs:
+        normalize_one(nt, doc, dct)
+    serial = nt.stats.snapshot()['counters']
+    nt.stats.reset()
+    run_threads(lambda i: [normalize_one(nt, doc, dct) for doc, dct in docs])
+    concurrent = nt.stats.snapshot()['counters']
+    assert concurrent == {name: count*N_THREADS for name, count in serial.items()}
+
+
+def test_concurrent_first_use_of_engine():
+    texts = [text for text, TYPE in EXPRESSIONS if TYPE == 'DATE']
+    reset_engine()
+    expected = [normtime.normalize(text, dct='2013-06-01') for text in texts]
+    for _ in range(3):
+        reset_engine()
+        results = run_threads(lambda i: (get_engine(),
+                                         [normtime.normalize(text, dct='2013-06-01') for text in texts]))
+        assert len({id(engine) for engine, _ in results}) == 1
+        assert results[0][0] is get_engine()
+        assert all(values == expected for _, values in results)
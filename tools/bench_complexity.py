@@ -0,0 +1,146 @@
+""" Worst-case complexity harness for pathological TIMEX inputs.
+
+For each suspected hot path, inputs of growing size are generated, and
+the time (best of --repeat) and the peak memory (tracemalloc) of one run
+are measured. The exponent k of size**k is fitted to both by least
+squares on a log-log scale. The exit status is 1 when an exponent is above
+the declared bound of its path by more than --tolerance.
+
+The bounds are the intended ones, linear in the input size for every path.
+A known failure above its intended bound is reported, and checked against
+a bound of its own instead, so that it still fails when it grows further:
+  digit_run, kansuji_run  time, n^2: the rules with '#+' are retried by
+                          re.finditer at every start position of a run of
+                          digits and scan the rest of it, so matching is
+                          quadratic in its length (max_timex_chars of NormTime
+                          bounds it).
+
+% python3 tools/bench_complexity.py
+% python3 tools/bench_complexity.py --paths digit_run --sizes 100 200 400 800 1600 3200
+"""
+import os
+import sys
+import math
+import time
+import argparse
+import tracemalloc
+from collections import namedtuple
+HERE = os.path.dirname(os.path.realpath(__file__))
+sys.path.append(f'{HERE}/..')
+from normtime import NormTime, TIMEX
+
+HotPath = namedtuple('HotPath', ('make', 'run', 'time_bound', 'memory_bound', 'known_failures'),
+                     defaults=({},))
+
+
+def single_timex(text, TYPE='DATE'):
+    return [(text, [TIMEX(str=text, begin_strid=0, end_strid=len(text), TYPE=TYPE)])]
+
+
+def dense_sentence(n):
+    """ A sentence of about n characters, a TIMEX in every 10 """
+    sentence = ''
+    timexes = []
+    for i in range(max(1, n//10)):
+        text = f'{2000+i%20}年{i%12+1}月{i%28+1}日'
+        timexes.append(TIMEX(str=text, begin_strid=len(sentence),
+                             end_strid=len(sentence)+len(text), TYPE='DATE'))
+        sentence += text + '、'
+    return [(sentence, timexes)]
+
+
+def normalize_doc(nt, doc):
+    try:
+        list(nt.normalize(doc, '2013-06-01'))
+    except Exception:
+        pass # only the cost matters here
+
+
+def mask_doc(nt, doc):
+    for sentence, timexes in doc:
+        nt.apply_rule.mask_sent(sentence, timexes)
+
+
+QUADRATIC_MATCHING = (2, "re.finditer rescans a run of digits from every start position")
+
+# make(size) --> doc, run(nt, doc),
+# known_failures: {'time' or 'memory': (bound of the known failure, reason)}
+HOT_PATHS = {
+    'digit_run': HotPath(lambda n: single_timex('1'*n + '年'), normalize_doc, 1, 1,
+                         {'time': QUADRATIC_MATCHING}),
+    'kansuji_run': HotPath(lambda n: single_timex('一二三四五六七八九十'*(n//10) + '年'),
+                           normalize_doc, 1, 1, {'time': QUADRATIC_MATCHING}),
+    'repeated_ymd': HotPath(lambda n: single_timex('2013年6月1日'*(n//10)), normalize_doc, 1, 1),
+    'mask_sent': HotPath(dense_sentence, mask_doc, 1, 1),
+    'dense_sentence': HotPath(dense_sentence, normalize_doc, 1, 1),
+}
+
+
+def measure_time(path, nt, doc, repeat):
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        path.run(nt, doc)
+        best = min(best, time.perf_counter()-start)
+    return best
+
+
+def measure_memory(path, nt, doc):
+    """ Peak bytes allocated during one run """
+    tracemalloc.start() # the peak starts from here
+    try:
+        base = tracemalloc.get_traced_memory()[0]
+        path.run(nt, doc)
+        return tracemalloc.get_traced_memory()[1] - base
+    finally:
+        tracemalloc.stop()
+
+
+def fit_exponent(sizes, values):
+    """ k of values ~ c*sizes**k, by least squares on log-log """
+    xs = [math.log(size) for size in sizes]
+    ys = [math.log(max(value, 1e-12)) for value in values]
+    mean_x, mean_y = sum(xs)/len(xs), sum(ys)/len(ys)
+    return sum((x-mean_x)*(y-mean_y) for x, y in zip(xs, ys)) \
+        / sum((x-mean_x)**2 for x in xs)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--paths', nargs='+', default=list(HOT_PATHS), choices=list(HOT_PATHS))
+    parser.add_argument('--sizes', type=int, nargs='+', default=[100, 200, 400, 800, 1600],
+                        help="Input sizes in characters.")
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--tolerance', type=float, default=0.3,
+                        help="Allowed excess of a fitted exponent over its bound.")
+    args = parser.parse_args()
+
+    nt = NormTime()
+    failures = []
+    for name in args.paths:
+        path = HOT_PATHS[name]
+        times, memories = [], []
+        for size in args.sizes:
+            doc = path.make(size)
+            path.run(nt, doc) # warm up the caches
+            times.append(measure_time(path, nt, doc, args.repeat))
+            memories.append(measure_memory(path, nt, doc))
+            print(f'{name}\t{size}\t{times[-1]*1000:.2f} ms\t{memories[-1]/1024:.1f} KiB')
+        for kind, values, bound in (('time', times, path.time_bound),
+                                    ('memory', memories, path.memory_bound)):
+            exponent = fit_exponent(args.sizes, values)
+            known_bound, reason = path.known_failures.get(kind, (None, None))
+            if exponent <= bound + args.tolerance:
+                ok, result = True, 'ok' + (' (known failure passed)' if reason else '')
+            elif reason:
+                ok = exponent <= known_bound + args.tolerance
+                result = f'known failure, bound n^{known_bound}: {reason}' + ('' if ok else ' FAIL')
+            else:
+                ok, result = False, 'FAIL'
+            print(f'{name}\t{kind}\tn^{exponent:.2f}\tbound n^{bound}\t{result}')
+            if not ok:
+                failures.append(f'{name} {kind}')
+
+    if failures:
+        print('Grew faster than the bound: ' + ', '.join(failures))
+        sys.exit(1)
@@ -0,0 +1,109 @@
+""" Micro-benchmark of num_ex.str2num on the strings it gets while normalizing.
+
+Records the arguments of str2num during normalization of sample documents,
+then times the former comparison-chain parser and the table-driven,
+memoized one on them, checking that both give the same results.
+
+% python3 tools/bench_num_ex.py --docs 1000
+"""
+import os
+import sys
+import time
+import argparse
+HERE = os.path.dirname(os.path.realpath(__file__))
+sys.path.append(f'{HERE}/..')
+from normtime import NormTime, num_ex, rule
+from sample_docs import make_docs
+
+
+def legacy_get_digit_list(uni_strings):
+    """ get_digit_list before the character table """
+    digit_list = []
+    zeroFlag = False
+    for uni_string in uni_strings:
+        num = None
+        if uni_string == u'0' or uni_string == u'０' or uni_string == u'〇' or uni_string == u'零': num = 0
+        elif uni_string == u'1' or uni_string == u'１' or uni_string == u'一': num = 1
+        elif uni_string == u'2' or uni_string == u'２' or uni_string == u'二': num = 2
+        elif uni_string == u'3' or uni_string == u'３' or uni_string == u'三': num = 3
+        elif uni_string == u'4' or uni_string == u'４' or uni_string == u'四': num = 4
+        elif uni_string == u'5' or uni_string == u'５' or uni_string == u'五': num = 5
+        elif uni_string == u'6' or uni_string == u'６' or uni_string == u'六': num = 6
+        elif uni_string == u'7' or uni_string == u'７' or uni_string == u'七': num = 7
+        elif uni_string == u'8' or uni_string == u'８' or uni_string == u'八': num = 8
+        elif uni_string == u'9' or uni_string == u'９' or uni_string == u'九': num = 9
+        elif uni_string == u'十': num = 10
+        elif uni_string == u'百': num = 100
+        elif uni_string == u'千': num = 1000
+        elif uni_string in [u'数',u'何']: num = -1
+
+        if uni_string == u'ゼ':
+            zeroFlag = True
+            continue
+        elif uni_string == u'ロ' and zeroFlag:
+            num, zeroFlag = 0, False
+        elif zeroFlag:
+            zeroFlag = False
+        digit_list.append(num)
+    return digit_list
+
+
+def legacy_str2num(string):
+    """ str2num before the character table and the cache """
+    digit_list = legacy_get_digit_list(string)
+    if None in digit_list:
+        return None
+    return num_ex.make_num(digit_list)
+
+
+def record_strings(docs):
+    """ Arguments of str2num while normalizing the documents, in call order. """
+    strings = []
+    def recording_str2num(string):
+        strings.append(string)
+        return num_ex.str2num(string)
+
+    nt = NormTime()
+    rule.str2num = recording_str2num
+    try:
+        for doc, dct in docs:
+            list(nt.normalize(doc, dct))
+    finally:
+        rule.str2num = num_ex.str2num
+    return strings
+
+
+def measure(func, strings, repeat):
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for string in strings:
+            func(string)
+        best = min(best, time.perf_counter()-start)
+    return best
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--docs', type=int, default=1000)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    strings = record_strings(make_docs(args.docs))
+    # The ゼロ and 'X' (数, 何) cases are rare in the sample; add them so they are checked too
+    strings += ['ゼロ', 'ゼロ歳', '十数', '数十', '数', '何', '二百三十', '２０１９', '〇']
+    mismatches = [s for s in set(strings) if legacy_str2num(s) != num_ex.str2num(s)]
+    print(f'{len(strings)} calls, {len(set(strings))} distinct strings, {len(mismatches)} mismatches')
+    if mismatches:
+        print(mismatches)
+        sys.exit(1)
+
+    legacy_time = measure(legacy_str2num, strings, args.repeat)
+    num_ex.str2num.cache_clear()
+    table_time = measure(num_ex.str2num.__wrapped__, strings, args.repeat)
+    num_ex.str2num.cache_clear()
+    cached_time = measure(num_ex.str2num, strings, args.repeat)
+    print(f'legacy\t{legacy_time*1000:.2f} ms')
+    print(f'table\t{table_time*1000:.2f} ms\t{legacy_time/table_time:.1f}x')
+    print(f'cached\t{cached_time*1000:.2f} ms\t{legacy_time/cached_time:.1f}x')
+    print(num_ex.cache_stats())
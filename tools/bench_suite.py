@@ -0,0 +1,181 @@
+""" Throughput benchmark suite of the normalization pipeline.
+
+Documents are generated from fixed expressions for each TIMEX TYPE and
+sentence length (TIMEXes per sentence), so no corpus is needed. For each
+case, the best of --repeat runs is reported as TIMEXes per second of
+NormTime.normalize, and microseconds per TIMEX of each stage:
+
+    mask_sent              ApplyRule.mask_sent
+    matching_rule          ApplyRule.matching_rule, on the masked sentences
+    get_time_compositions  ApplyRule.get_time_compositions (the two above included)
+    resolver               time_composition.resolver, on the TimeCompositions
+
+% python3 tools/bench_suite.py -o base.json
+% python3 tools/bench_suite.py -o new.json
+% python3 tools/bench_suite.py --compare base.json new.json --threshold 0.1
+
+--compare exits with status 1 when the throughput of a case dropped, or
+the cost of a stage rose, by more than the threshold.
+"""
+import os
+import sys
+import json
+import time
+import random
+import platform
+import argparse
+HERE = os.path.dirname(os.path.realpath(__file__))
+sys.path.append(f'{HERE}/..')
+from normtime import NormTime, TIMEX
+from normtime.time_composition import resolver
+from sample_docs import EXPRESSIONS, FILLERS
+
+TYPES = ('DATE', 'TIME', 'DURATION', 'SET')
+LENGTHS = {'short': 1, 'medium': 5, 'long': 20} # TIMEXes per sentence
+STAGES = ('mask_sent', 'matching_rule', 'get_time_compositions', 'resolver')
+
+
+def make_case_docs(TYPE, n_timexes, n_sentences, seed=0):
+    """ Documents of 4 sentences with n_timexes TIMEXes of TYPE each, with their DCTs. """
+    rand = random.Random(seed)
+    expressions = [text for text, expr_type in EXPRESSIONS if expr_type == TYPE]
+    docs = []
+    for _ in range(0, n_sentences, 4):
+        doc = []
+        for _ in range(4):
+            sentence = ''
+            timexes = []
+            for _ in range(n_timexes):
+                text = rand.choice(expressions)
+                timexes.append(TIMEX(str=text, begin_strid=len(sentence),
+                                     end_strid=len(sentence)+len(text), TYPE=TYPE))
+                sentence += text + rand.choice(FILLERS)
+            doc.append((sentence, timexes))
+        dct = f'{rand.randint(1990, 2030)}-{rand.randint(1, 12):02}-{rand.randint(1, 28):02}'
+        docs.append((doc, dct))
+    return docs
+
+
+def best_time(func, repeat):
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter()-start)
+    return best
+
+
+def run_case(nt, docs, repeat):
+    apply_rule = nt.apply_rule
+    sentences = [(sentence, timexes) for doc, _ in docs for sentence, timexes in doc]
+    masked = [(apply_rule.mask_sent(sentence, timexes), timexes) for sentence, timexes in sentences]
+    time_compositions = [(apply_rule.get_time_compositions(doc), dct) for doc, dct in docs]
+    n_timex = sum(len(timexes) for _, timexes in sentences)
+
+    def normalize():
+        for doc, dct in docs:
+            list(nt.normalize(doc, dct))
+
+    def mask_sent():
+        for sentence, timexes in sentences:
+            apply_rule.mask_sent(sentence, timexes)
+
+    def matching_rule():
+        for masked_sent, timexes in masked:
+            apply_rule.matching_rule(masked_sent, timexes)
+
+    def get_time_compositions():
+        for doc, _ in docs:
+            apply_rule.get_time_compositions(doc)
+
+    def resolve():
+        for cps, dct in time_compositions:
+            list(resolver(cps, dct, apply_rule.era_index))
+
+    stage_funcs = {'mask_sent': mask_sent, 'matching_rule': matching_rule,
+                   'get_time_compositions': get_time_compositions, 'resolver': resolve}
+    elapsed = best_time(normalize, repeat)
+    return {'timexes': n_timex,
+            'timex_per_sec': n_timex/elapsed,
+            'us_per_timex': {stage: best_time(stage_funcs[stage], repeat)/n_timex*1e6
+                             for stage in STAGES}}
+
+
+def run(args):
+    nt = NormTime(matcher=args.matcher)
+    cases = {}
+    for TYPE in args.types:
+        for length in args.lengths:
+            docs = make_case_docs(TYPE, LENGTHS[length], args.sentences)
+            cases[f'{TYPE}/{length}'] = run_case(nt, docs, args.repeat)
+            print_case(f'{TYPE}/{length}', cases[f'{TYPE}/{length}'])
+    return {'meta': {'python': platform.python_version(),
+                     'implementation': platform.python_implementation(),
+                     'machine': platform.machine(),
+                     'matcher': args.matcher,
+                     'sentences': args.sentences,
+                     'repeat': args.repeat},
+            'cases': cases}
+
+
+def print_case(name, case):
+    stages = '  '.join(f'{stage} {case["us_per_timex"][stage]:.1f}' for stage in STAGES)
+    print(f'{name:16} {case["timex_per_sec"]:9.0f} timex/s  us/timex: {stages}', file=sys.stderr)
+
+
+def compare(base, new, threshold):
+    """ Prints the ratios new/base of each case and returns the regressions. """
+    regressions = []
+    for key, value in base['meta'].items():
+        if new['meta'].get(key) != value:
+            print(f'Note: {key} differs, {value} -> {new["meta"].get(key)}')
+    print(f'{"case":16} {"timex/s":>8}  ' + '  '.join(f'{stage:>21}' for stage in STAGES))
+    for name, new_case in new['cases'].items():
+        base_case = base['cases'].get(name)
+        if base_case is None:
+            continue
+        speed = new_case['timex_per_sec'] / base_case['timex_per_sec']
+        if speed < 1-threshold:
+            regressions.append(f'{name} timex/s')
+        ratios = []
+        for stage in STAGES:
+            ratio = new_case['us_per_timex'][stage] / base_case['us_per_timex'][stage]
+            if ratio > 1+threshold:
+                regressions.append(f'{name} {stage}')
+            ratios.append(f'{ratio:21.2f}')
+        print(f'{name:16} {speed:8.2f}  ' + '  '.join(ratios))
+    return regressions
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-o', '--output', help="JSON file of the results.")
+    parser.add_argument('--types', nargs='+', default=TYPES, choices=TYPES)
+    parser.add_argument('--lengths', nargs='+', default=list(LENGTHS), choices=list(LENGTHS))
+    parser.add_argument('--sentences', type=int, default=200, help="Sentences per case.")
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--matcher', default='loop', choices=['loop', 'scanner'])
+    parser.add_argument('--compare', nargs=2, metavar=('BASE', 'NEW'),
+                        help="Compare two result files instead of running.")
+    parser.add_argument('--threshold', type=float, default=0.1,
+                        help="Relative slowdown reported as a regression by --compare.")
+    args = parser.parse_args()
+
+    if args.compare:
+        with open(args.compare[0]) as f:
+            base = json.load(f)
+        with open(args.compare[1]) as f:
+            new = json.load(f)
+        regressions = compare(base, new, args.threshold)
+        if regressions:
+            print('Regressions: ' + ', '.join(regressions))
+            sys.exit(1)
+        sys.exit(0)
+
+    results = run(args)
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=1)
+    else:
+        json.dump(results, sys.stdout, indent=1)
+        print()
@@ -0,0 +1,82 @@
+""" Concurrency check and thread scaling benchmark of a shared NormTime.
+
+Normalizes the same documents from many threads at once with one NormTime
+and checks every result against the single-threaded one (exit status 1 on
+a mismatch or an exception), then measures the throughput for each number
+of threads. On free-threaded builds of CPython (python3.13t, ..) the
+threads run in parallel; with the GIL the throughput stays flat.
+tests/test_threads.py runs the same check under pytest.
+
+% python3 tools/bench_threads.py --threads 1 2 4 8
+"""
+import os
+import sys
+import time
+import random
+import argparse
+import threading
+from concurrent.futures import ThreadPoolExecutor
+HERE = os.path.dirname(os.path.realpath(__file__))
+sys.path.append(f'{HERE}/..')
+from normtime import NormTime
+from sample_docs import make_docs, normalize_one
+
+
+def normalize_all(nt, docs):
+    return [normalize_one(nt, doc, dct) for doc, dct in docs]
+
+
+def check(nt, docs, n_threads, rounds):
+    """ Returns the number of documents whose results differ from the serial run. """
+    expected = normalize_all(nt, docs)
+    start = threading.Barrier(n_threads)
+
+    def worker(seed):
+        order = list(range(len(docs)))
+        random.Random(seed).shuffle(order)
+        start.wait()
+        mismatches = 0
+        for _ in range(rounds):
+            for i in order:
+                doc, dct = docs[i]
+                if normalize_one(nt, doc, dct) != expected[i]:
+                    mismatches += 1
+        return mismatches
+
+    with ThreadPoolExecutor(n_threads) as executor:
+        return sum(executor.map(worker, range(n_threads)))
+
+
+def throughput(nt, docs, n_threads):
+    """ Documents per second when n_threads threads share the documents. """
+    shares = [docs[i::n_threads] for i in range(n_threads)]
+    with ThreadPoolExecutor(n_threads) as executor:
+        begin = time.perf_counter()
+        list(executor.map(lambda share: normalize_all(nt, share), shares))
+        return len(docs) / (time.perf_counter()-begin)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--threads', type=int, nargs='+', default=[1, 2, 4, 8])
+    parser.add_argument('--docs', type=int, default=1000)
+    parser.add_argument('--rounds', type=int, default=3, help="Passes over the documents per thread in the check.")
+    parser.add_argument('--matcher', default='loop', choices=['loop', 'scanner'])
+    args = parser.parse_args()
+
+    is_gil_enabled = getattr(sys, '_is_gil_enabled', lambda: True)()
+    print(f'{sys.version.split()[0]}, GIL {"enabled" if is_gil_enabled else "disabled"}, {os.cpu_count()} CPUs')
+    nt = NormTime(matcher=args.matcher)
+    docs = make_docs(args.docs)
+
+    mismatches = check(nt, docs, max(args.threads), args.rounds)
+    print(f'check: {max(args.threads)} threads, {mismatches} mismatches')
+    if mismatches:
+        sys.exit(1)
+
+    print('threads\tdocs/s\tscaling')
+    base = None
+    for n_threads in args.threads:
+        docs_per_sec = throughput(nt, docs, n_threads)
+        base = base or docs_per_sec
+        print(f'{n_threads}\t{docs_per_sec:.0f}\t{docs_per_sec/base:.2f}x')
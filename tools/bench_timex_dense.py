@@ -0,0 +1,65 @@
+""" Benchmark of the candidate RuleMatch lookup on TIMEX-dense sentences.
+
+Compares the former set-based containment test with RuleMatchIndex.
+
+% python3 tools/bench_timex_dense.py --sizes 10 50 200
+"""
+import os
+import sys
+import time
+import argparse
+HERE = os.path.dirname(os.path.realpath(__file__))
+sys.path.append(f'{HERE}/..')
+from normtime import TIMEX
+from normtime.rule import ApplyRule, RuleMatchIndex
+
+
+def make_dense_sentence(n_timex):
+    """ 「2019年1月1日、2019年1月2日、…」のようにTIMEXが密に並ぶ文 """
+    sentence = ''
+    timexes = []
+    for i in range(n_timex):
+        text = f'{2000+i%20}年{i%12+1}月{i%28+1}日'
+        timexes.append(TIMEX(str=text, begin_strid=len(sentence),
+                             end_strid=len(sentence)+len(text), TYPE='DATE'))
+        sentence += text + '、'
+    return sentence, timexes
+
+
+def lookup_by_sets(matches, timexes):
+    for timex in timexes:
+        [rm for rm in matches
+         if set(range(timex.begin_strid, timex.end_strid)) >= set(range(rm.begin_strid, rm.end_strid))]
+
+
+def lookup_by_index(matches, timexes):
+    match_index = RuleMatchIndex(matches)
+    for timex in timexes:
+        match_index.inside(timex.begin_strid, timex.end_strid)
+
+
+def measure(func, *args, repeat=5):
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func(*args)
+        best = min(best, time.perf_counter()-start)
+    return best
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--sizes', type=int, nargs='+', default=[10, 50, 200],
+                        help="Numbers of timexes per sentence.")
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    apply_rule = ApplyRule()
+    print('timexes\tmatches\tsets[ms]\tindex[ms]\tspeedup')
+    for n_timex in args.sizes:
+        sentence, timexes = make_dense_sentence(n_timex)
+        masked_sent = apply_rule.mask_sent(sentence, timexes)
+        matches = apply_rule.match_rules(masked_sent, timexes)
+        sets_time = measure(lookup_by_sets, matches, timexes, repeat=args.repeat)
+        index_time = measure(lookup_by_index, matches, timexes, repeat=args.repeat)
+        print(f'{n_timex}\t{len(matches)}\t{sets_time*1000:.2f}\t{index_time*1000:.2f}\t{sets_time/index_time:.1f}x')
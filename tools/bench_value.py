@@ -0,0 +1,76 @@
+""" Per-TIMEX benchmark of the value stage (time_composition.calc_value).
+
+TimeCompositions and valueFromSurface are prepared beforehand, so only the
+resolution of values against the DCT is timed. The memory held by the
+TimeCompositions of the documents (with their TimeData) is reported per
+TIMEX, as measured by tracemalloc.
+
+% python3 tools/bench_value.py --docs 2000
+"""
+import os
+import sys
+import time
+import argparse
+import tracemalloc
+HERE = os.path.dirname(os.path.realpath(__file__))
+sys.path.append(f'{HERE}/..')
+from normtime import NormTime
+from normtime.time_composition import resolve_parallel, resolve_functions, calc_vfs, calc_value
+from sample_docs import make_docs
+
+
+def prepare(nt, docs):
+    """ [(time_compositions, vfs_list, dct)] of the documents whose values can be calculated. """
+    inputs = []
+    for doc, dct in docs:
+        time_compositions = resolve_functions(resolve_parallel(nt.apply_rule.get_time_compositions(doc)))
+        vfs_list = calc_vfs(time_compositions)
+        try:
+            calc_value(list(time_compositions), vfs_list, dct)
+        except Exception:
+            continue
+        inputs.append((time_compositions, vfs_list, dct))
+    return inputs
+
+
+def measure_memory(nt, docs):
+    """ Bytes per TIMEX held by the TimeCompositions of the documents """
+    docs = [doc for doc, _ in docs]
+    for doc in docs:
+        nt.apply_rule.get_time_compositions(doc) # warm up the caches
+    tracemalloc.start()
+    try:
+        base = tracemalloc.get_traced_memory()[0]
+        time_compositions = [nt.apply_rule.get_time_compositions(doc) for doc in docs]
+        size = tracemalloc.get_traced_memory()[0] - base
+    finally:
+        tracemalloc.stop()
+    # less the lists holding them
+    size -= sum(sys.getsizeof(cps) for cps in time_compositions) + sys.getsizeof(time_compositions)
+    return size / sum(len(cps) for cps in time_compositions)
+
+
+def measure(inputs, repeat):
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for time_compositions, vfs_list, dct in inputs:
+            calc_value(list(time_compositions), vfs_list, dct)
+        best = min(best, time.perf_counter()-start)
+    return best
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--docs', type=int, default=2000)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    nt = NormTime()
+    docs = make_docs(args.docs)
+    inputs = prepare(nt, docs)
+    n_timex = sum(len(vfs_list) for _, vfs_list, _ in inputs)
+    elapsed = measure(inputs, args.repeat)
+    print(f'{len(inputs)} docs, {n_timex} timexes')
+    print(f'value stage: {elapsed*1000:.1f} ms, {elapsed/n_timex*1e6:.2f} us/timex')
+    print(f'TimeComposition: {measure_memory(nt, docs):.0f} bytes/timex')
@@ -1,60 +1,108 @@
 import os
 import sys
 import argparse
+import multiprocessing
 import random
 from datetime import datetime
-from collections import defaultdict
+from collections import defaultdict, deque
 HERE = os.path.dirname(os.path.realpath(__file__))
 sys.path.append(f'{HERE}/..')
 from normtime import NormTime, TIMEX
-from timebank import read_input
+from timebank import iter_input
 
-def evaluate(xml_dir, debug):
-    timebank_docs = []
-    for xml_fname in os.listdir(xml_dir):
-        if not xml_fname.endswith('xml'):
-            continue
-        timebank_doc = read_input(txt_file=f'{xml_dir}/{xml_fname}', lang='ja')
-        timebank_docs.append(timebank_doc)
+def evaluate(xml_dir, debug, processes=None):
+    """ Evaluate on the XML files of xml_dir, sharding them over processes
+    (os.cpu_count() by default, 1: in this process). Each worker reads and
+    normalizes whole files; their results are printed in file name order,
+    so the output does not depend on the number of processes.
+    """
+    txt_files = [f'{xml_dir}/{xml_fname}' for xml_fname in sorted(os.listdir(xml_dir))
+                 if xml_fname.endswith('xml')]
+    processes = processes or os.cpu_count() or 1
+    if processes == 1:
+        _init_worker(debug)
+        results = map(evaluate_file, txt_files)
+        pool = None
+    else:
+        pool = multiprocessing.Pool(processes, initializer=_init_worker, initargs=(debug,))
+        results = pool.imap(evaluate_file, txt_files)
+
+    vfs_match_cnt, v_match_cnt, ans_cnt = 0,0,0
+    try:
+        for lines, file_vfs_match_cnt, file_v_match_cnt, file_ans_cnt in results:
+            for line in lines:
+                print(line)
+            vfs_match_cnt += file_vfs_match_cnt
+            v_match_cnt += file_v_match_cnt
+            ans_cnt += file_ans_cnt
+    finally:
+        if pool is not None:
+            pool.terminate()
+    print(f'ACC: ValueFromSurface {vfs_match_cnt/ans_cnt:.3f} ({vfs_match_cnt}/{ans_cnt})  Value {v_match_cnt/ans_cnt:.3f} ({v_match_cnt}/{ans_cnt})')
+
+
+_worker_normtime = None
 
 
-    nt = NormTime(debug) 
+def _init_worker(debug):
+    global _worker_normtime
+    _worker_normtime = NormTime(debug)
+
+
+def evaluate_file(txt_file):
+    """ Returns the lines to print and the counts of matching valueFromSurface,
+    matching value and TIMEXes of a file. """
+    lines = []
     vfs_match_cnt, v_match_cnt, ans_cnt = 0,0,0
-    for timebank_doc in timebank_docs:
-        sentid2timexids = defaultdict(list) # {sent_id: [timex_id]}
-        for tnid,timex_node in enumerate(timebank_doc.timex_nodes):
-            sentid2timexids[timex_node.sentence_id].append(tnid)
-        
-        doc = []
-        doc_timex_ids = []
-        for sent_id,sent_timex_ids in sorted(sentid2timexids.items()):
-            sent = timebank_doc.sentences[sent_id].text # string
+    for timex_node, vfs, v in normalize_file(_worker_normtime, txt_file):
+        text = timex_node.text
+        TYPE = timex_node.TYPE
+
+        gold_vfs = timex_node.valueFromSurface
+        gold_v = timex_node.value
+
+        vfs_match_cnt += int(vfs==gold_vfs)
+        v_match_cnt += int(v==gold_v)
+        ans_cnt += 1
+
+        lines.append(f'{txt_file}\t{text}\t{TYPE}\tvalueFromSurface:: sys:{vfs} gold:{gold_vfs} {vfs==gold_vfs}\tvalue:: sys:{v} gold:{gold_v} {v==gold_v}')
+    return lines, vfs_match_cnt, v_match_cnt, ans_cnt
+
+
+def normalize_file(nt, txt_file):
+    """ Normalize the TIMEX3s of a TimeBank XML file while reading it.
+
+    Yields:
+        Tuple[TimexNode, str, str]: TimexNode, valueFromSurface and value.
+    """
+    items = iter_input(txt_file)
+    _, dct = next(items)
+    timex_nodes = deque() # given to nt.normalize, not yet yielded
+
+    def read_doc():
+        sentid2timex_nodes = defaultdict(list) # {sent_id: [TimexNode]}
+        for kind, item in items:
+            if kind == 'timex':
+                sentid2timex_nodes[item.sentence_id].append(item)
+                continue
+            sent_timex_nodes = sentid2timex_nodes.pop(item.id, None)
+            if not sent_timex_nodes:
+                continue
+            sent = item.text # string
             sent_timexes = []
             i = 0
-            for timex_id in sent_timex_ids:
-                timex_node = timebank_doc.timex_nodes[timex_id]
+            for timex_node in sent_timex_nodes:
                 begin_strid = sent[i:].index(timex_node.text)
                 sent_timexes.append(TIMEX(  str=timex_node.text,
                                                 begin_strid=i+begin_strid,
                                                 end_strid=i+begin_strid+len(timex_node.text),
                                                 TYPE=timex_node.TYPE))
                 i += begin_strid+len(timex_node.text)
-                doc_timex_ids.append(timex_id)
-            doc.append((sent,sent_timexes))
-
-        for timex_id, (vfs,v) in zip(doc_timex_ids, nt.normalize(doc, timebank_doc.dct)):
-            text = timebank_doc.timex_nodes[timex_id].text
-            TYPE = timebank_doc.timex_nodes[timex_id].TYPE
+                timex_nodes.append(timex_node)
+            yield sent, sent_timexes
 
-            gold_vfs = timebank_doc.timex_nodes[timex_id].valueFromSurface
-            gold_v = timebank_doc.timex_nodes[timex_id].value
-
-            vfs_match_cnt += int(vfs==gold_vfs)
-            v_match_cnt += int(v==gold_v)
-            ans_cnt += 1
-        
-            print(f'{timebank_doc.txt_file}\t{text}\t{TYPE}\tvalueFromSurface:: sys:{vfs} gold:{gold_vfs} {vfs==gold_vfs}\tvalue:: sys:{v} gold:{gold_v} {v==gold_v}')
-    print(f'ACC: ValueFromSurface {vfs_match_cnt/ans_cnt:.3f} ({vfs_match_cnt}/{ans_cnt})  Value {v_match_cnt/ans_cnt:.3f} ({v_match_cnt}/{ans_cnt})')
+    for vfs, v in nt.normalize(read_doc(), dct):
+        yield timex_nodes.popleft(), vfs, v
 
 
 def test(txt_file, dct):
@@ -92,9 +140,11 @@ if __name__ == '__main__':
     parser.add_argument('-t', '--test_txt')
     parser.add_argument('--dct', '--test_json', default=datetime.now().strftime('%Y-%m-%d'))
     parser.add_argument('--debug', action='store_true')
+    parser.add_argument('-p', '--processes', type=int, default=None,
+                        help="Worker processes for -x (default: number of CPUs).")
     args = parser.parse_args()
 
     if args.xml_dir:
-        evaluate(args.xml_dir, args.debug)
+        evaluate(args.xml_dir, args.debug, args.processes)
     elif args.test_txt:
         test(args.test_txt, args.dct)
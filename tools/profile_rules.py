@@ -0,0 +1,68 @@
+""" Per-rule cost and use of rule/strRule.json on a corpus.
+
+Normalizes JSONL documents (see normtime/document.py), or generated ones
+without an input, and writes for each rule the seconds spent in its
+finditer, its raw matches, and how often its matches inside a TIMEX were
+selected into the chain or discarded. Rules that cost much and are rarely
+selected are the ones to look at.
+
+% python3 tools/profile_rules.py docs.jsonl --sort seconds --format tsv | head
+% python3 tools/profile_rules.py --docs 2000 --format json -o profile.json
+"""
+import os
+import sys
+import json
+import argparse
+HERE = os.path.dirname(os.path.realpath(__file__))
+sys.path.append(f'{HERE}/..')
+from normtime import NormTime
+from normtime.document import doc_from_json
+from normtime.stats import RULE_PROFILE_KEYS
+from sample_docs import make_docs
+
+
+def read_docs(path):
+    with open(path, encoding='utf-8') as f:
+        for line in f:
+            if line.strip():
+                yield doc_from_json(json.loads(line))
+
+
+def write_tsv(rows, fout):
+    fout.write('\t'.join(RULE_PROFILE_KEYS) + '\n')
+    for row in rows:
+        fout.write('\t'.join(str(row[key]) for key in RULE_PROFILE_KEYS) + '\n')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('input', nargs='?', help="JSONL documents (default: generated ones).")
+    parser.add_argument('--docs', type=int, default=1000, help="Generated documents without input.")
+    parser.add_argument('--sort', default='seconds', choices=RULE_PROFILE_KEYS)
+    parser.add_argument('--format', default='tsv', choices=['tsv', 'json'])
+    parser.add_argument('-o', '--output', default='-')
+    args = parser.parse_args()
+
+    # The per-rule time needs the loop matcher
+    nt = NormTime(matcher='loop', rule_profile=True)
+    docs = read_docs(args.input) if args.input else make_docs(args.docs)
+    errors = 0
+    for doc, dct in docs:
+        try:
+            list(nt.normalize(doc, dct))
+        except Exception:
+            errors += 1
+    if errors:
+        print(f'{errors} documents raised an exception', file=sys.stderr)
+
+    rows = nt.apply_rule.rule_profile.report(sort_by=args.sort, reverse=(args.sort != 'rule_id'))
+    fout = sys.stdout if args.output == '-' else open(args.output, 'w', encoding='utf-8')
+    try:
+        if args.format == 'json':
+            json.dump(rows, fout, ensure_ascii=False, indent=1)
+            fout.write('\n')
+        else:
+            write_tsv(rows, fout)
+    finally:
+        if fout is not sys.stdout: # do not close stdout
+            fout.close()
@@ -0,0 +1,46 @@
+""" Generated documents for the benchmarks in tools/ and tests/test_threads.py.
+
+Random sentences built from TIMEX expressions of every TYPE, with their DCTs.
+"""
+import os
+import sys
+import random
+HERE = os.path.dirname(os.path.realpath(__file__))
+sys.path.append(f'{HERE}/..')
+from normtime import TIMEX
+
+EXPRESSIONS = [('2013年6月1日', 'DATE'), ('来年4/26', 'DATE'), ('平成25年', 'DATE'),
+               ('昭和五十年代', 'DATE'), ('去年の春', 'DATE'), ('3日前', 'DATE'),
+               ('翌日', 'DATE'), ('17、', 'DATE'), ('18日', 'DATE'), ('月曜日', 'DATE'),
+               ('午後3時', 'TIME'), ('正午', 'TIME'), ('3日間', 'DURATION'),
+               ('半日', 'DURATION'), ('二週間', 'DURATION'), ('毎週', 'SET'),
+               ('毎年', 'SET'), ('2週間前', 'DATE')]
+FILLERS = ['に', 'から', 'まで', 'の会議は', '、', 'には雨が降った。']
+
+
+def make_docs(n_docs, seed=0):
+    """ Documents of random sentences built from EXPRESSIONS, with their DCTs. """
+    rand = random.Random(seed)
+    docs = []
+    for _ in range(n_docs):
+        doc = []
+        for _ in range(rand.randint(1, 4)):
+            sentence = ''
+            timexes = []
+            for _ in range(rand.randint(1, 5)):
+                text, TYPE = rand.choice(EXPRESSIONS)
+                timexes.append(TIMEX(str=text, begin_strid=len(sentence),
+                                     end_strid=len(sentence)+len(text), TYPE=TYPE))
+                sentence += text + rand.choice(FILLERS)
+            doc.append((sentence, timexes))
+        dct = f'{rand.randint(1990, 2030)}-{rand.randint(1, 12):02}-{rand.randint(1, 28):02}'
+        docs.append((doc, dct))
+    return docs
+
+
+def normalize_one(nt, doc, dct):
+    """ Results of the document, or the name of the exception it raises. """
+    try:
+        return list(nt.normalize(doc, dct))
+    except Exception as e:
+        return type(e).__name__
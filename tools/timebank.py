@@ -6,6 +6,7 @@ import codecs
 import os
 import re
 from xml.dom import minidom
+from xml.etree import ElementTree
 from optparse import OptionParser
 
 eventAttribs = ['eid',  'class']
@@ -318,6 +319,160 @@ def delete_ruby(xdoc):
         txt_node = xdoc.createTextNode(text)
         parent.replaceChild(txt_node, node)
 
+def iter_input(txt_file, sentences=True, timexes=True):
+    """ Streaming, selective version of read_input(txt_file, lang='ja').
+
+    The XML is parsed incrementally and each sentence element is dropped
+    once read, so memory stays proportional to one sentence. Only what is
+    asked for is yielded, in document order:
+
+        ('dct', str)                      value of the first TIMEX3, always first
+        ('timex', TimexNode)              if timexes
+        ('sentence', TimeBankSentence)    if sentences, after its TimexNodes
+
+    Sentences and TimexNodes are the same as those of read_input, except
+    that EVENT annotations are not read (annotation is always empty).
+    With neither sentences nor timexes, parsing stops at the DCT.
+    """
+    reader = SentenceReader(timexes)
+    stack = [] # open elements
+    in_sentence = 0 # depth of sentence elements
+    dct = None
+    for event, elem in ElementTree.iterparse(txt_file, events=('start', 'end')):
+        if event == 'start':
+            stack.append(elem)
+            if elem.tag == 'TIMEX3' and dct is None:
+                dct = elem.get('value', '')
+                yield 'dct', dct
+                if not sentences and not timexes:
+                    return
+            if elem.tag == 'sentence':
+                in_sentence += 1
+            continue
+
+        stack.pop()
+        if elem.tag == 'sentence':
+            in_sentence -= 1
+            if in_sentence == 0:
+                for kind, item in reader.read_sentence(elem):
+                    if kind == 'timex' or sentences:
+                        yield kind, item
+        if in_sentence == 0:
+            # 読み終えた要素は木から外す
+            elem.clear()
+            if stack:
+                stack[-1].remove(elem)
+
+    for kind, item in reader.finish():
+        if sentences:
+            yield kind, item
+
+
+class SentenceReader(object):
+    """ Splits sentence elements into TimeBankSentences as read_input does for 'ja'.
+
+    read_input appends a remaining "''" to the previous sentence, so each
+    sentence is held until the next one is complete.
+    """
+    def __init__(self, timexes=True):
+        self.timexes = timexes
+        self.sentence = ''
+        self.sentence_id = 0
+        self.last_sentence = None # complete, not yet returned
+        self.output = [] # (kind, item) to return
+
+    def read_sentence(self, elem):
+        """ Returns the ('timex', TimexNode) and ('sentence', TimeBankSentence)
+        completed by the sentence element. """
+        for node in child_nodes(elem):
+            if not isinstance(node, str) and node.tag == 'quote':
+                for child_node in child_nodes(node):
+                    self.process_node(child_node)
+            else:
+                self.process_node(node)
+        # 残り
+        if self.sentence:
+            self.end_sentence()
+        output, self.output = self.output, []
+        return output
+
+    def finish(self):
+        if self.last_sentence is not None:
+            self.output.append(('sentence', self.last_sentence))
+            self.last_sentence = None
+        output, self.output = self.output, []
+        return output
+
+    def end_sentence(self):
+        if self.last_sentence is not None:
+            self.output.append(('sentence', self.last_sentence))
+        self.last_sentence = TimeBankSentence(self.sentence_id, self.sentence, annotation=[])
+        self.sentence = ''
+        self.sentence_id += 1
+
+    def process_node(self, node):
+        """ process_child_node for 'ja' """
+        if isinstance(node, str):
+            self.process_text(node)
+            return
+        if node.tag == 'sampling':
+            return
+
+        if node.tag == 'TIMEX3' and self.timexes:
+            nodes = list(child_nodes(node))
+            if len(nodes) == 1:
+                text = nodes[0].strip() if isinstance(nodes[0], str) else ''
+            else:
+                text = ''.join(n.strip() for n in nodes if isinstance(n, str))
+            self.output.append(('timex', TimexNode(
+                self.sentence_id, node.get('tid', None), text, node.attrib['type'],
+                node.attrib['value'], node.get('valueFromSurface', "None"),
+                node.get('mod', 'None'), node.get('quant', 'None'))))
+
+        for text in child_nodes(node):
+            if not isinstance(text, str) or text.strip() == '':
+                continue
+            if node.tag != 'enclosedCharacter':
+                self.sentence += text.strip('\n')
+            else: # enclosedCharacter の場合は前後に記号を埋めておく
+                self.sentence += u"＊"+text.strip('\n')+u"＊"
+
+    def process_text(self, data):
+        chars = data.strip('\n')
+        for pos, char in enumerate(chars):
+            if char == '\n':
+                # 余ったダブルクォーテーションは前の文にくっつける
+                if self.sentence == '\'\'' and self.last_sentence is not None:
+                    self.last_sentence.text += ' \'\''
+                    self.sentence = ''
+            elif char == u' ' or char == u'　':
+                self.sentence += u"＊"
+            else:
+                self.sentence += char
+
+            sentence = self.sentence
+            if (char == '.' and not sentence.endswith(("Mr.", "Mrs.", "Ms.", "Corp.", "St.", "U.", "U.S.", "U.N.")) and not (len(sentence) > 1 and sentence[-2].isdigit() and pos + 1 < len(chars) and chars[pos+1].isdigit())) or char == '?' or char == u'。':
+                self.end_sentence()
+
+
+def child_nodes(elem):
+    """ The children of an ElementTree element as minidom sees them: texts
+    as str and elements, ruby replaced by its text as delete_ruby does. """
+    if elem.text:
+        yield elem.text
+    for child in elem:
+        yield ruby_text(child) if child.tag == 'ruby' else child
+        if child.tail:
+            yield child.tail
+
+
+def ruby_text(ruby):
+    if ruby.text:
+        return ruby.text.strip()
+    for child in ruby: # 'ruby' の中に 'missingCharacter' が入れ子になっている
+        return (child.text or '').strip()
+    return ''
+
 if __name__ == "__main__":
 #    sys.stdout = codecs.getwriter("utf-8")(sys.stdout)
 